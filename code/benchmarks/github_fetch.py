@@ -0,0 +1,100 @@
+#!/bin/python3.8
+# times fetching PR metadata from the local GitHub stub, one PR at a time against concurrently
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import github_client
+from github_stub import make_server, write_recording, BASE_PLACEHOLDER
+
+REPO = "bench/repo"
+
+def record(recordings_dir, path, body, etag, link=None):
+    headers = {"ETag": etag}
+    if link is not None:
+        headers["Link"] = link
+    write_recording(recordings_dir, path, {"status": 200, "headers": headers, "body": body})
+
+def make_recordings(recordings_dir, num_prs, num_users, reviews_per_pr, seed):
+    rand = random.Random(seed)
+    users = ["user" + str(i) for i in range(num_users)]
+
+    record(recordings_dir, "/repos/" + REPO, {"name": "repo", "clone_url": "https://example.com/repo.git"}, '"repo"')
+    for login in users:
+        record(recordings_dir, "/users/" + login, {"login": login, "email": login + "@example.com"}, '"' + login + '"')
+
+    for pr_id in range(1, num_prs + 1):
+        path = "/repos/" + REPO + "/pulls/" + str(pr_id)
+        record(recordings_dir, path, {"number": pr_id, "merged": True, "user": {"login": rand.choice(users)},
+                "head": {"sha": "%040x" % pr_id}, "merge_commit_sha": "%040x" % (pr_id + num_prs), "commits": 1},
+                '"pr' + str(pr_id) + '"')
+
+        # two pages of reviews so pagination is part of the timing
+        reviews = [{"user": {"login": rand.choice(users)}} for _ in range(reviews_per_pr)]
+        half = len(reviews) // 2
+        page = path + "/reviews?per_page=" + str(github_client.PAGE_SIZE)
+        next_page = page + "&page=2"
+        record(recordings_dir, page, reviews[:half], '"r' + str(pr_id) + '"',
+                "<" + BASE_PLACEHOLDER + next_page + '>; rel="next"')
+        record(recordings_dir, next_page, reviews[half:], '"r' + str(pr_id) + 'p2"')
+
+def fetch(base_url, num_prs):
+    start = time.time()
+    _, prs = github_client.fetch_metadata(None, REPO, list(range(1, num_prs + 1)), True, base_url)
+    return time.time() - start, prs
+
+def main():
+    parser = argparse.ArgumentParser(description="time PR metadata fetching against the GitHub stub")
+    parser.add_argument("--prs", type=int, default=200)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--reviews", type=int, default=4, help="reviews per PR")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per stub response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_github_fetch.json")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="github_bench_")
+    recordings_dir = os.path.join(work_dir, "recordings")
+    make_recordings(recordings_dir, args.prs, args.users, args.reviews, args.seed)
+
+    server = make_server(port=0, recordings_dir=recordings_dir, latency=args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://" + server.server_address[0] + ":" + str(server.server_address[1])
+
+    results = {"prs": args.prs, "latency": args.latency}
+    try:
+        # one PR and one connection at a time, as the PyGithub path does
+        github_client.ETAG_CACHE_DIR = os.path.join(work_dir, "etags_sequential") + "/"
+        connections, concurrent_prs = github_client.MAX_CONNECTIONS, github_client.MAX_CONCURRENT_PRS
+        github_client.MAX_CONNECTIONS, github_client.MAX_CONCURRENT_PRS = 1, 1
+        results["sequential"], sequential = fetch(base_url, args.prs)
+        github_client.MAX_CONNECTIONS, github_client.MAX_CONCURRENT_PRS = connections, concurrent_prs
+
+        github_client.ETAG_CACHE_DIR = os.path.join(work_dir, "etags") + "/"
+        results["concurrent"], concurrent = fetch(base_url, args.prs)
+        # every response now has an ETag to send back
+        requests = server.counters["requests"]
+        results["revalidated"], revalidated = fetch(base_url, args.prs)
+        results["not_modified"] = server.counters["not_modified"]
+        results["revalidated_requests"] = server.counters["requests"] - requests
+
+        results["same"] = sequential == concurrent == revalidated
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir)
+
+    print(json.dumps(results, indent=2))
+    f = open(args.output, "w")
+    json.dump(results, f, indent=2)
+    f.close()
+
+if __name__ == "__main__":
+    main()
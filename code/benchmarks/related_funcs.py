@@ -0,0 +1,89 @@
+#!/bin/python3.8
+# compares handle_related_funcs against the old query per call path
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import py_parse
+from fact_writer import FactWriter
+from storage import connect_storage
+
+def fill_facts(db, num_files, funcs_per_file, calls_per_func, seed):
+    rand = random.Random(seed)
+    writer = FactWriter(db)
+
+    for i in range(num_files):
+        filename = "mod" + str(i) + ".py"
+        filepath = "pkg/" + filename
+        line = 1
+
+        for j in range(funcs_per_file):
+            size = rand.randint(5, 40)
+            writer.add("functions", (filename, filepath, "func" + str(j), line, line + size))
+
+            for _ in range(calls_per_func):
+                call_line = rand.randint(line + 1, line + size)
+                base = "mod" + str(rand.randrange(num_files))
+                name = "func" + str(rand.randrange(funcs_per_file))
+                writer.add("func_call", (filename, filepath, base, name, call_line, call_line))
+
+            line += size + 1
+
+    writer.flush()
+
+def old_handle_related_funcs(db):
+    # the previous path, two lookups for every call and one insert per pair
+    for res in db.rows("func_call"):
+        callers = db.find_inner_funcs(res["filename"], res["start_line"], res["end_line"])
+        funcs = db.find_funcs(res["base_name"] + ".py", res["name"])
+
+        for caller in callers:
+            for func in funcs:
+                db.insert_rows("related_funcs", ("caller_id", "called_id"), [(caller["id"], func["id"])])
+                db.commit()
+
+def time_related_funcs(db, handle):
+    db.clear(["related_funcs"])
+
+    start = time.time()
+    handle(db)
+    elapsed = time.time() - start
+
+    pairs = sorted((row["caller_id"], row["called_id"]) for row in db.rows("related_funcs"))
+
+    return elapsed, pairs
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark handle_related_funcs")
+    parser.add_argument("--storage", default="memory")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--funcs", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db = connect_storage(args.storage)
+    db.clear()
+    fill_facts(db, args.files, args.funcs, args.calls, args.seed)
+
+    old_time, old_pairs = time_related_funcs(db, old_handle_related_funcs)
+    new_time, new_pairs = time_related_funcs(db, py_parse.handle_related_funcs)
+
+    if old_pairs != new_pairs:
+        print("related funcs differ between the old and new path")
+        sys.exit(1)
+
+    num_calls = args.files * args.funcs * args.calls
+    print("calls", num_calls, "related pairs", len(new_pairs))
+    print("old path", round(old_time, 3), "seconds")
+    print("new path", round(new_time, 3), "seconds")
+    print("speedup", round(old_time / new_time, 1) if new_time > 0 else "inf")
+
+    db.close()
+
+if __name__ == "__main__":
+    main()
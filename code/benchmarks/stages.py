@@ -0,0 +1,118 @@
+#!/bin/python3.8
+# times each stage of rank_PR on a synthetic repository and writes the results as JSON
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import blame
+import fact_cache
+import py_parse
+from storage import connect_storage
+from synthetic_repo import make_repo
+
+def code_version():
+    try:
+        return subprocess.run(["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "HEAD"],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+                universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_stages(repo_path, base, pr_commit, db, workers):
+    # one run of every stage against an empty snapshot, returns seconds per stage
+    timings = {}
+
+    def timed(name, func, *args):
+        start = time.time()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = func(*args)
+        timings[name] = time.time() - start
+        return result
+
+    db.clear()
+    repo = py_parse.get_repo(repo_path)
+    py_parse.change_repo_commit(repo, base)
+    files = py_parse.get_repo_files(repo, base)
+
+    timed("extract", py_parse.extract_facts, db, files, workers)
+    timed("related_funcs", py_parse.handle_related_funcs, db)
+    timed("ownership", py_parse.assign_files_ownership, repo, db, base, files)
+
+    py_parse.change_repo_commit(repo, pr_commit)
+    timed("changes", py_parse.get_changes, repo, db, base, repo_path, pr_commit)
+
+    timed("modified_rank", py_parse.modified_code_rank, db)
+    timed("related_rank", py_parse.related_code_rank, db)
+    timed("api_rank", py_parse.api_usage_rank, db)
+
+    py_parse.change_repo_commit(repo, base)
+
+    return timings, len(files)
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the stages of rank_PR")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--funcs", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--authors", type=int, default=5)
+    parser.add_argument("--commits", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--storage", default="memory")
+    parser.add_argument("--source", default=py_parse.SOURCE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default="benchmark_stages.json")
+    args = parser.parse_args()
+
+    py_parse.SOURCE = args.source
+
+    work_dir = tempfile.mkdtemp(prefix="review_bench_")
+    repo_path = os.path.join(work_dir, "repo")
+
+    try:
+        base, pr_commit = make_repo(repo_path, args.files, args.funcs, args.calls, args.authors, args.commits,
+                seed=args.seed)
+
+        db = connect_storage(args.storage)
+        runs = []
+        for i in range(args.repeat):
+            # fresh caches so every run parses and blames every file
+            blame.BLAME_CACHE_DIR = os.path.join(work_dir, "blame" + str(i)) + "/"
+            fact_cache.FACT_CACHE_DIR = os.path.join(work_dir, "facts" + str(i)) + "/"
+            timings, num_files = run_stages(repo_path, base, pr_commit, db, args.workers)
+            runs.append(timings)
+        db.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+    stages = {}
+    for name in runs[0]:
+        seconds = [run[name] for run in runs]
+        stages[name] = {"seconds": seconds, "min": min(seconds), "mean": sum(seconds) / len(seconds)}
+
+    results = {
+        "version": code_version(),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "num_files": num_files,
+        "stages": stages,
+    }
+
+    f = open(args.output, "w")
+    json.dump(results, f, indent=2)
+    f.close()
+
+    for name, stage in stages.items():
+        print(name, round(stage["min"], 4), "seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/bin/python3.8
+# builds a throwaway git repository of python files with a known shape
+import argparse
+import os
+import random
+import subprocess
+
+def git(repo_path, args, author=None):
+    env = dict(os.environ)
+    if author is not None:
+        env.update({"GIT_AUTHOR_NAME": author.split("@")[0], "GIT_AUTHOR_EMAIL": author,
+                "GIT_COMMITTER_NAME": "benchmark", "GIT_COMMITTER_EMAIL": "benchmark@example.com"})
+
+    return subprocess.run(["git", "-C", repo_path] + args, stdout=subprocess.PIPE, check=True,
+            env=env, universal_newlines=True).stdout.strip()
+
+class SyntheticRepo:
+    def __init__(self, path, num_files, funcs_per_file, call_density, num_authors, seed):
+        self.path = path
+        self.rand = random.Random(seed)
+        self.authors = ["author" + str(i) + "@example.com" for i in range(num_authors)]
+        self.call_density = call_density
+
+        # module name -> function name -> body lines
+        self.modules = {}
+        for i in range(num_files):
+            module = "mod" + str(i)
+            self.modules[module] = {}
+            for j in range(funcs_per_file):
+                self.modules[module]["func" + str(j)] = [self.random_call(module) for _ in range(call_density)]
+
+    def random_call(self, module):
+        callee_module = self.rand.choice(list(self.modules.keys()) + [module])
+        callee = "func" + str(self.rand.randrange(max(len(self.modules.get(callee_module, {})), 1)))
+
+        if callee_module == module:
+            return "    value = " + callee + "(value)"
+
+        return "    value = " + callee_module + "." + callee + "(value)"
+
+    def render(self, module):
+        lines = ["import pkg." + other + " as " + other for other in sorted(self.modules) if other != module]
+        lines.append("")
+
+        for name, body in self.modules[module].items():
+            lines.append("def " + name + "(value):")
+            lines += body
+            lines.append("    return value")
+            lines.append("")
+
+        lines.append("class " + module.capitalize() + ":")
+        lines.append("    def run(self, value):")
+        lines.append("        return self.helper(value)")
+        lines.append("")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, modules):
+        os.makedirs(os.path.join(self.path, "pkg"), exist_ok=True)
+
+        for module in modules:
+            f = open(os.path.join(self.path, "pkg", module + ".py"), "w")
+            f.write(self.render(module))
+            f.close()
+
+    def commit(self, message):
+        git(self.path, ["add", "-A"])
+        git(self.path, ["commit", "-q", "-m", message], self.rand.choice(self.authors))
+
+        return git(self.path, ["rev-parse", "HEAD"])
+
+    def edit(self, num_modules):
+        # rewrite a call in a few functions and add a new function to one module
+        modules = self.rand.sample(list(self.modules), min(num_modules, len(self.modules)))
+
+        for module in modules:
+            funcs = self.modules[module]
+            name = self.rand.choice(list(funcs))
+            body = funcs[name]
+            body[self.rand.randrange(len(body))] = self.random_call(module)
+
+        new_module = self.rand.choice(modules)
+        new_name = "func" + str(len(self.modules[new_module]))
+        self.modules[new_module][new_name] = [self.random_call(new_module) for _ in range(self.call_density)]
+
+        self.write(modules)
+
+def make_repo(path, num_files=50, funcs_per_file=10, call_density=3, num_authors=5, num_commits=20,
+        files_per_commit=3, seed=0):
+    # returns (base commit, PR commit), the PR commit is on its own branch
+    os.makedirs(path)
+    git(path, ["init", "-q"])
+
+    repo = SyntheticRepo(path, num_files, max(funcs_per_file, 1), max(call_density, 1), num_authors, seed)
+    repo.write(list(repo.modules))
+    base = repo.commit("initial")
+
+    for i in range(num_commits - 1):
+        repo.edit(files_per_commit)
+        base = repo.commit("change " + str(i))
+
+    git(path, ["checkout", "-q", "-b", "pr"])
+    repo.edit(files_per_commit)
+    pr_commit = repo.commit("pull request")
+    git(path, ["checkout", "-q", base])
+
+    return base, pr_commit
+
+def main():
+    parser = argparse.ArgumentParser(description="generate a synthetic repository")
+    parser.add_argument("path")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--funcs", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--authors", type=int, default=5)
+    parser.add_argument("--commits", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    base, pr_commit = make_repo(args.path, args.files, args.funcs, args.calls, args.authors, args.commits,
+            seed=args.seed)
+    print("base", base)
+    print("pr", pr_commit)
+
+if __name__ == "__main__":
+    main()
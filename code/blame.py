@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import subprocess
+import profiling
+from concurrent.futures import ThreadPoolExecutor
+
+BLAME_CACHE_DIR = "cache/blame/"
+
+def strip_mail(mail):
+    if mail.startswith("<") and mail.endswith(">"):
+        return mail[1:-1]
+
+    return mail
+
+def parse_incremental(lines):
+    # each group is "<sha> <orig line> <final line> <num lines>", commit details the first
+    # time a sha is seen, then a closing "filename" line
+    emails = {}
+    groups = []
+    header = None
+
+    for line in lines:
+        line = line.rstrip("\n")
+        if header is None:
+            parts = line.split(" ")
+            header = (parts[0], int(parts[2]), int(parts[3]))
+        elif line.startswith("author-mail "):
+            emails[header[0]] = strip_mail(line[len("author-mail "):])
+        elif line.startswith("filename "):
+            groups.append(header)
+            header = None
+
+    # groups come out in the order they are found, not in line order
+    groups.sort(key=lambda group: group[1])
+
+    author_lines = {}
+    last_author = None
+
+    for sha, start, num_lines in groups:
+        email = emails[sha]
+        if email not in author_lines:
+            author_lines[email] = []
+
+        if email == last_author:
+            author_lines[email][-1] = (author_lines[email][-1][0], start + num_lines - 1)
+        else:
+            author_lines[email].append((start, start + num_lines - 1))
+
+        last_author = email
+
+    return author_lines
+
+def cache_path(commit, path):
+    return BLAME_CACHE_DIR + commit + "/" + hashlib.sha1(path.encode()).hexdigest() + ".json"
+
+def read_cache(commit, path):
+    filename = cache_path(commit, path)
+    if not os.path.isfile(filename):
+        return None
+
+    f = open(filename)
+    cached = json.load(f)
+    f.close()
+
+    return {email: [tuple(pair) for pair in pairs] for email, pairs in cached.items()}
+
+def write_cache(commit, path, author_lines):
+    filename = cache_path(commit, path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    # write then rename so other workers never read a partial file
+    tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    f = open(tmp_filename, "w")
+    json.dump(author_lines, f)
+    f.close()
+    os.replace(tmp_filename, filename)
+
+def blame_file(repo_path, commit, path):
+    cached = read_cache(commit, path)
+    if cached is not None:
+        profiling.count("blame_cache_hits")
+        return cached
+
+    profiling.count("blame_runs")
+
+    # stream the output so only the line groups are kept
+    process = subprocess.Popen(["git", "-C", repo_path, "blame", "--incremental", commit, "--", path],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="utf-8", errors="replace")
+    author_lines = parse_incremental(process.stdout)
+    process.stdout.close()
+
+    # blame fails if the file is not in the commit
+    if process.wait() != 0:
+        return {}
+
+    write_cache(commit, path, author_lines)
+
+    return author_lines
+
+def blame_files(repo_path, commit, paths, workers):
+    # yields (path, author lines) in the order of paths
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = executor.map(lambda path: blame_file(repo_path, commit, path), paths)
+        for path, author_lines in zip(paths, results):
+            yield path, author_lines
@@ -0,0 +1,137 @@
+import subprocess
+import profiling
+from diffs import iter_diff
+
+# past this many commits blaming the changed files again is cheaper than walking every diff
+MAX_CARRY_COMMITS = 200
+
+def git(repo_path, *args):
+    return subprocess.run(["git", "-C", repo_path] + list(args), stdout=subprocess.PIPE, encoding="utf-8",
+            errors="replace").stdout
+
+def first_parent_commits(repo_path, old_commit, commit):
+    # (sha, parents, author email) from old_commit to commit, None unless commit is a descendant of old_commit
+    # reached along the first parent chain
+    previous = git(repo_path, "rev-parse", "--verify", "-q", old_commit + "^{commit}").strip()
+    target = git(repo_path, "rev-parse", "--verify", "-q", commit + "^{commit}").strip()
+    if previous == "" or target == "":
+        return None
+
+    if previous == target:
+        return []
+
+    # log old..new is empty when new is older, diffs only ever move ownership forward
+    if subprocess.run(["git", "-C", repo_path, "merge-base", "--is-ancestor", previous, target]).returncode != 0:
+        return None
+
+    output = git(repo_path, "log", "--first-parent", "--reverse", "--format=%H %P%x09%aE", previous + ".." + target)
+
+    commits = []
+    for line in output.splitlines():
+        shas, email = line.split("\t", 1)
+        shas = shas.split(" ")
+
+        # a rewritten history or a base that is not on the first parent chain
+        if len(shas) < 2 or shas[1] != previous:
+            return None
+
+        commits.append((shas[0], shas[1:], email))
+        previous = shas[0]
+
+    if len(commits) == 0 or previous != target:
+        return None
+
+    return commits
+
+def clip(intervals, start, end, offset, result):
+    # parts of sorted intervals inside start to end, moved by offset
+    for interval_start, interval_end, author in intervals:
+        if interval_end < start:
+            continue
+        if interval_start > end:
+            break
+        result.append((max(interval_start, start) + offset, min(interval_end, end) + offset, author))
+
+def shift_intervals(intervals, hunks, author):
+    # sorted (start, end, author) on the old side of zero context hunks to the new side,
+    # deleted lines are dropped and inserted lines belong to the commit's author
+    result = []
+    old_line = 1
+    offset = 0
+
+    for old_start, old_count, new_start, new_count in sorted(hunks):
+        # a hunk with no old lines inserts after old_start
+        last_kept = old_start if old_count == 0 else old_start - 1
+        clip(intervals, old_line, last_kept, offset, result)
+
+        if new_count > 0:
+            result.append((new_start, new_start + new_count - 1, author))
+
+        # a hunk with no new lines deletes after new_start
+        next_new_line = new_start + 1 if new_count == 0 else new_start + new_count
+        old_line = last_kept + 1 + old_count
+        offset = next_new_line - old_line
+
+    clip(intervals, old_line, float("inf"), offset, result)
+
+    # neighbouring lines of one author are one interval, as blame writes them
+    merged = []
+    for interval in result:
+        if len(merged) > 0 and merged[-1][2] == interval[2] and merged[-1][1] + 1 == interval[0]:
+            merged[-1] = (merged[-1][0], interval[1], interval[2])
+        else:
+            merged.append(interval)
+
+    return merged
+
+def to_intervals(author_lines):
+    return sorted((pair[0], pair[1], author) for author, lines in author_lines.items() for pair in lines)
+
+def to_author_lines(intervals):
+    author_lines = {}
+    for start, end, author in intervals:
+        author_lines.setdefault(author, []).append((start, end))
+
+    return author_lines
+
+def carry_author_lines(repo_path, old_commit, commit, paths, load):
+    # author lines at commit for paths, from the ones at old_commit (load(path)) and the diffs in between;
+    # paths missing from the result have to be blamed
+    commits = first_parent_commits(repo_path, old_commit, commit)
+    if commits is None or len(commits) > MAX_CARRY_COMMITS:
+        return {}
+
+    # intervals per path at the commit reached so far, None once a path has to be blamed
+    files = {}
+
+    def intervals(path):
+        if path not in files:
+            files[path] = to_intervals(load(path))
+        return files[path]
+
+    for sha, parents, email in commits:
+        for change in iter_diff(repo_path, parents[0], sha):
+            path = change["path"]
+            old_path = change["old_path"]
+            old_intervals = [] if old_path is None else intervals(old_path)
+
+            # a deleted or renamed path has no lines until it is added again
+            if old_path is not None and old_path != path:
+                files[old_path] = []
+            if path is None:
+                continue
+
+            # lines a merge brings in were written on the other side, only blame knows by whom
+            if len(parents) > 1 or old_intervals is None:
+                files[path] = None
+            else:
+                files[path] = shift_intervals(old_intervals, change["hunks"], email)
+
+    # a changed path no diff touched means the walk missed something, it is blamed instead
+    carried = {}
+    for path in paths:
+        if files.get(path) is not None:
+            carried[path] = to_author_lines(files[path])
+
+    profiling.count("blame_carried", len(carried))
+    return carried
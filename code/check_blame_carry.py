@@ -0,0 +1,69 @@
+#!/bin/python3.8
+# fails if ownership carried from an earlier snapshot differs from a full blame, moving forward and back
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import blame
+from blame import blame_file
+from blame_carry import carry_author_lines
+from synthetic_repo import make_repo
+
+# commits apart in each checked pair
+STEPS = [1, 2, 5]
+
+def git(repo_path, *args):
+    return subprocess.run(["git", "-C", repo_path] + list(args), stdout=subprocess.PIPE, check=True,
+            universal_newlines=True).stdout
+
+def normalize(author_lines):
+    return {author: sorted(tuple(pair) for pair in lines) for author, lines in author_lines.items()}
+
+def check(repo_path, old_commit, commit):
+    # changed paths whose carried lines differ from blame, paths left out are blamed and always match
+    changed = git(repo_path, "diff", "--name-only", "--no-renames", old_commit, commit, "--", "*.py").split()
+    carried = carry_author_lines(repo_path, old_commit, commit, changed,
+            lambda path: blame_file(repo_path, old_commit, path))
+
+    wrong = [path for path, author_lines in carried.items()
+            if normalize(author_lines) != normalize(blame_file(repo_path, commit, path))]
+
+    return len(carried), wrong
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="blame_carry_check_")
+    blame.BLAME_CACHE_DIR = os.path.join(work_dir, "blame") + "/"
+    repo_path = os.path.join(work_dir, "repo")
+
+    failed = 0
+    checked = 0
+    try:
+        base, pr_commit = make_repo(repo_path)
+        commits = git(repo_path, "rev-list", "--first-parent", "--reverse", base).split()
+
+        pairs = [(commits[i], commits[i + step]) for step in STEPS for i in range(len(commits) - step)]
+        # backward moves and the PR branch, nothing may be carried from a commit that is not an ancestor
+        pairs += [(commit, old_commit) for old_commit, commit in pairs]
+        pairs += [(commits[-1], pr_commit), (pr_commit, commits[-1]), (pr_commit, commits[len(commits) // 2])]
+
+        for old_commit, commit in pairs:
+            num_carried, wrong = check(repo_path, old_commit, commit)
+            checked += 1
+            if len(wrong) > 0:
+                failed += 1
+                print("FAIL", old_commit[:10], "->", commit[:10], ", ".join(wrong))
+            else:
+                print("ok", old_commit[:10], "->", commit[:10], num_carried, "carried")
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(failed, "of", checked, "moves carry different ownership than blame")
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/bin/python3.8
+# fails if a rank query or a per file lookup has to scan a whole snapshot table
+import json
+import sys
+
+from storage import connect_storage, RANK_QUERIES, ROLLUPS
+
+# tables that grow with the repository, the modified tables only ever hold one PR
+HOT_TABLES = ["functions", "classes", "func_call", "contributor_ownership", "func_ownership", "class_ownership",
+        "file_ownership", "api_ownership", "related_funcs"] + ROLLUPS
+
+# lookups run once per file or per PR, literals stand in for the parameters
+LOOKUP_QUERIES = {
+    "functions_by_filepath": "SELECT * FROM functions WHERE filepath = 'a/b.py'",
+    "classes_by_filepath": "SELECT * FROM classes WHERE filepath = 'a/b.py'",
+    "func_call_by_filepath": "SELECT * FROM func_call WHERE filepath = 'a/b.py'",
+    "find_funcs": "SELECT * FROM functions where filename = 'b.py' and name = 'f'",
+    "find_inner_funcs": "SELECT * FROM functions where filename = 'b.py' and start_line <= 10 and end_line >= 12",
+    "remove_func_ownership": "DELETE FROM func_ownership WHERE func_id IN "
+        + "(SELECT id FROM functions WHERE filepath = 'a/b.py')",
+    "remove_class_ownership": "DELETE FROM class_ownership WHERE class_id IN "
+        + "(SELECT id FROM classes WHERE filepath = 'a/b.py')",
+    "remove_file_ownership": "DELETE FROM file_ownership WHERE file_path = 'a/b.py'",
+    "remove_contributor_ownership": "DELETE FROM contributor_ownership WHERE filepath = 'a/b.py'",
+    "remove_api_ownership": "DELETE FROM api_ownership WHERE filepath = 'a/b.py'",
+}
+
+# index scans with no condition read the whole index
+INDEX_SCANS = ["Index Scan", "Index Only Scan"]
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        for node in plan_nodes(child):
+            yield node
+
+def full_scans(plan):
+    scans = []
+    for node in plan_nodes(plan):
+        table = node.get("Relation Name")
+        if table not in HOT_TABLES:
+            continue
+
+        if node["Node Type"] == "Seq Scan":
+            scans.append("Seq Scan on " + table)
+        elif node["Node Type"] in INDEX_SCANS and "Index Cond" not in node:
+            scans.append(node["Node Type"] + " on " + table + " without a condition")
+
+    return scans
+
+def explain(c, query):
+    rows = list(c.execute("EXPLAIN (FORMAT JSON) " + query, ()))
+    plan = rows[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return plan[0]["Plan"]
+
+def main():
+    db = connect_storage("postgres")
+    c = db.conn.cursor()
+
+    # with sequential scans priced out any that remain have no index to use instead
+    c.execute("SET enable_seqscan = off", ())
+
+    queries = dict(RANK_QUERIES)
+    queries.update(LOOKUP_QUERIES)
+
+    failed = 0
+    for name, query in queries.items():
+        scans = full_scans(explain(c, query))
+        if len(scans) > 0:
+            failed += 1
+            print("FAIL", name, "; ".join(scans))
+        else:
+            print("ok", name)
+
+    c.close()
+    db.conn.rollback()
+    db.close()
+
+    print(failed, "of", len(queries), "queries scan a whole table")
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import subprocess
+
+def strip_prefix(path, prefix):
+    # "/dev/null" stands in for the missing side of an added or deleted file
+    if path == "/dev/null":
+        return None
+
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1]
+
+    if path.startswith(prefix):
+        return path[len(prefix):]
+
+    return path
+
+def parse_hunk_header(line):
+    # "@@ -old_start[,old_count] +new_start[,new_count] @@"
+    parts = line.split(' ')
+    old = parts[1][1:].split(',')
+    new = parts[2][1:].split(',')
+
+    old_count = int(old[1]) if len(old) > 1 else 1
+    new_count = int(new[1]) if len(new) > 1 else 1
+
+    return int(old[0]), old_count, int(new[0]), new_count
+
+def changed_lines(hunks):
+    # new side line ranges, a pure deletion marks the line it follows
+    ranges = []
+
+    for old_start, old_count, new_start, new_count in hunks:
+        if new_count == 0:
+            ranges.append((new_start, new_start))
+        else:
+            ranges.append((new_start, new_start + new_count - 1))
+
+    return ranges
+
+def parse_diff(lines):
+    # yields one record per file as soon as its hunks have been read
+    record = None
+    in_header = False
+
+    for line in lines:
+        line = line.rstrip("\n")
+
+        if line.startswith("diff --git "):
+            if record is not None:
+                yield record
+
+            record = {"path": None, "old_path": None, "hunks": [], "status": "modified"}
+            in_header = True
+        elif record is None:
+            continue
+        elif line.startswith("@@"):
+            in_header = False
+            record["hunks"].append(parse_hunk_header(line))
+        elif in_header:
+            # content lines can start with --- or +++ so headers are only read before the first hunk
+            if line.startswith("--- "):
+                record["old_path"] = strip_prefix(line[4:], "a/")
+            elif line.startswith("+++ "):
+                record["path"] = strip_prefix(line[4:], "b/")
+            elif line.startswith("rename from "):
+                record["old_path"] = line[len("rename from "):]
+                record["status"] = "renamed"
+            elif line.startswith("rename to "):
+                record["path"] = line[len("rename to "):]
+            elif line.startswith("new file mode"):
+                record["status"] = "added"
+            elif line.startswith("deleted file mode"):
+                record["status"] = "deleted"
+
+    if record is not None:
+        yield record
+
+def iter_diff(repo_path, base_commit, commit, paths=("*.py", )):
+    # zero context hunks so the ranges only cover changed lines, read from the pipe as git writes them
+    process = subprocess.Popen(["git", "-C", repo_path, "-c", "core.quotePath=false", "diff", "-U0", "--no-color",
+            "--no-ext-diff", "-M", base_commit, commit, "--"] + list(paths),
+            stdout=subprocess.PIPE, encoding="utf-8", errors="surrogateescape")
+
+    try:
+        for record in parse_diff(process.stdout):
+            yield record
+    finally:
+        process.stdout.close()
+        process.wait()
@@ -0,0 +1,113 @@
+import hashlib
+import marshal
+import os
+import zlib
+
+import profiling
+
+FACT_CACHE_DIR = "cache/facts/"
+# least recently used entries are removed once the cache grows past this
+FACT_CACHE_BYTES = 512 * 1024 * 1024
+# bump when the extracted rows change so old entries are never read
+FACT_CACHE_VERSION = 1
+
+# tables whose rows start with (filename, filepath), only the rest is stored
+TABLES = ["functions", "classes", "func_call"]
+
+stats = {"hits": 0, "misses": 0}
+# bytes in each cache directory, counted on first write
+sizes = {}
+
+def cache_path(blob, filename):
+    # the module name is part of the key as calls inside a module are resolved against it
+    key = hashlib.sha1((str(FACT_CACHE_VERSION) + "\0" + blob + "\0" + filename)
+            .encode("utf-8", "surrogateescape")).hexdigest()
+
+    return os.path.join(FACT_CACHE_DIR, key[:2], key)
+
+def pack(rows, error):
+    if error is not None:
+        return zlib.compress(marshal.dumps({"error": str(error)}))
+
+    return zlib.compress(marshal.dumps({table: [row[2:] for row in rows[table]] for table in TABLES}))
+
+def unpack(data, filename, filepath):
+    facts = marshal.loads(zlib.decompress(data))
+    if "error" in facts:
+        return None, facts["error"]
+
+    prefix = (filename, filepath)
+    return {table: [prefix + tuple(row) for row in facts[table]] for table in TABLES}, None
+
+def read_facts(blob, filename, filepath):
+    # (rows, error) for a blob that was parsed before, None otherwise
+    filename_path = cache_path(blob, filename)
+
+    try:
+        f = open(filename_path, "rb")
+        data = f.read()
+        f.close()
+        facts = unpack(data, filename, filepath)
+    except (OSError, ValueError, EOFError, TypeError, zlib.error):
+        # missing, evicted by another process or cut short
+        stats["misses"] += 1
+        profiling.count("fact_cache_misses")
+        return None
+
+    # the modification time orders entries for eviction
+    try:
+        os.utime(filename_path)
+    except OSError:
+        pass
+
+    stats["hits"] += 1
+    profiling.count("fact_cache_hits")
+    return facts
+
+def write_facts(blob, filename, rows, error):
+    filename_path = cache_path(blob, filename)
+    data = pack(rows, error)
+
+    os.makedirs(os.path.dirname(filename_path), exist_ok=True)
+    tmp_filename = filename_path + "." + str(os.getpid()) + ".tmp"
+    f = open(tmp_filename, "wb")
+    f.write(data)
+    f.close()
+    os.replace(tmp_filename, filename_path)
+
+    if FACT_CACHE_DIR not in sizes:
+        sizes[FACT_CACHE_DIR] = sum(size for _, size, _ in cache_entries())
+    else:
+        sizes[FACT_CACHE_DIR] += len(data)
+
+    if sizes[FACT_CACHE_DIR] > FACT_CACHE_BYTES:
+        evict()
+
+def cache_entries():
+    entries = []
+    for root, _, filenames in os.walk(FACT_CACHE_DIR):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+
+    return entries
+
+def evict():
+    # oldest first until well under the cap so eviction does not run on every write
+    entries = sorted(cache_entries())
+    size = sum(entry[1] for entry in entries)
+
+    for _, entry_size, path in entries:
+        if size <= FACT_CACHE_BYTES * 0.9:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        size -= entry_size
+
+    sizes[FACT_CACHE_DIR] = size
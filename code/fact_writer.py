@@ -0,0 +1,54 @@
+import time
+
+# columns written for each buffered fact table
+FACT_TABLES = {
+    "functions": ("filename", "filepath", "name", "start_line", "end_line"),
+    "classes": ("filename", "filepath", "name", "start_line", "end_line"),
+    "func_call": ("filename", "filepath", "base_name", "name", "start_line", "end_line"),
+    "modified_funcs": ("filename", "filepath", "name"),
+    "modified_classes": ("filename", "filepath", "name"),
+    "modified_files": ("filepath", ),
+}
+
+class FactWriter:
+    def __init__(self, db):
+        self.db = db
+        self.rows = {table: [] for table in FACT_TABLES}
+        self.func_call_counts = {}
+
+    def add(self, table, row):
+        self.rows[table].append(row)
+
+    def extend(self, rows):
+        for table, table_rows in rows.items():
+            self.rows[table].extend(table_rows)
+
+    def add_modified_call(self, base_name, name):
+        key = (base_name, name)
+        self.func_call_counts[key] = self.func_call_counts.get(key, 0) + 1
+
+    def num_rows(self):
+        return sum(len(rows) for rows in self.rows.values()) + len(self.func_call_counts)
+
+    def flush(self):
+        num_rows = self.num_rows()
+        if num_rows == 0:
+            return
+
+        start = time.time()
+
+        # everything goes in as one transaction
+        for table, columns in FACT_TABLES.items():
+            self.db.insert_rows(table, columns, self.rows[table])
+
+        # counts are already summed per key so each key only appears once
+        counts = [(key[0], key[1], count) for key, count in self.func_call_counts.items()]
+        self.db.add_counts("modified_func_calls", ("base_name", "name"), counts)
+        self.db.commit()
+
+        elapsed = time.time() - start
+        rate = num_rows / elapsed if elapsed > 0 else float(num_rows)
+        print("wrote", num_rows, "rows in", round(elapsed, 3), "seconds,", round(rate), "rows/s")
+
+        self.rows = {table: [] for table in FACT_TABLES}
+        self.func_call_counts = {}
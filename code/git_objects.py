@@ -0,0 +1,60 @@
+import os
+import subprocess
+
+class GitObjects:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.process = None
+
+    def list_files(self, commit):
+        # (path, blob sha) for every file in the commit, submodules are skipped
+        output = subprocess.run(["git", "-C", self.repo_path, "ls-tree", "-r", "-z", "--full-tree", commit],
+                stdout=subprocess.PIPE, check=True).stdout
+
+        files = []
+        for entry in output.split(b"\0"):
+            if len(entry) == 0:
+                continue
+
+            info, path = entry.split(b"\t", 1)
+            obj_type, sha = info.split(b" ")[1:]
+            if obj_type == b"blob":
+                files.append((path.decode("utf-8", "surrogateescape"), sha.decode("ascii")))
+
+        return files
+
+    def read(self, name):
+        # name is a blob sha or "<commit>:<path>", None if it does not exist
+        if self.process is None:
+            self.process = subprocess.Popen(["git", "-C", self.repo_path, "cat-file", "--batch"],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        self.process.stdin.write(name.encode("utf-8", "surrogateescape") + b"\n")
+        self.process.stdin.flush()
+
+        header = self.process.stdout.readline()
+        if header.endswith(b" missing\n"):
+            return None
+
+        size = int(header.split()[2])
+        data = self.process.stdout.read(size)
+        # contents are followed by a newline
+        self.process.stdout.read(1)
+
+        return data
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+# one cat-file process per repo and per process, forked workers open their own
+opened = {}
+
+def open_git_objects(repo_path):
+    key = (os.getpid(), repo_path)
+    if key not in opened:
+        opened[key] = GitObjects(repo_path)
+
+    return opened[key]
@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import aiohttp
+
+from github_stub import write_recording, BASE_PLACEHOLDER
+
+GITHUB_API = "https://api.github.com"
+# keep-alive connections shared by every request
+MAX_CONNECTIONS = 8
+# PRs fetched at once
+MAX_CONCURRENT_PRS = 16
+REQUEST_TIMEOUT = 60
+# tries for a request the rate limit turned away
+MAX_RETRIES = 3
+# share of the rate limit kept back, spread over the rest of the window once everything else is spent
+RESERVE_SHARE = 0.1
+PAGE_SIZE = 100
+
+# ETag and body of every response, sent back as If-None-Match so unchanged data costs nothing
+ETAG_CACHE_DIR = "cache/github/"
+
+def etag_path(url):
+    return os.path.join(ETAG_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+def read_etag(url):
+    filename = etag_path(url)
+    if not os.path.isfile(filename):
+        return None
+
+    f = open(filename)
+    cached = json.load(f)
+    f.close()
+
+    return cached
+
+def write_etag(url, cached):
+    filename = etag_path(url)
+    os.makedirs(ETAG_CACHE_DIR, exist_ok=True)
+
+    tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    f = open(tmp_filename, "w")
+    json.dump(cached, f)
+    f.close()
+    os.replace(tmp_filename, filename)
+
+def next_link(link):
+    # url of rel="next" in a Link header, None on the last page
+    if link is None:
+        return None
+
+    for part in link.split(","):
+        url, _, params = part.partition(";")
+        if 'rel="next"' in params:
+            return url.strip()[1:-1]
+
+    return None
+
+class TokenBucket:
+    # requests go out as fast as they come until only the reserve of the rate limit is left,
+    # the reserve is then spread over the time left in the window
+    def __init__(self, limit=5000, window=3600):
+        self.limit = limit
+        self.window = window
+        self.reserve = max(int(limit * RESERVE_SHARE), 1)
+        # requests left in the window, from the last response less the ones sent since
+        self.tokens = limit
+        self.window_end = time.monotonic() + window
+        # earliest time for the next request once only the reserve is left
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+        self.waited = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        if now >= self.window_end:
+            # a new window starts with the whole limit
+            self.tokens = self.limit
+            self.window_end = now + self.window
+        return now
+
+    async def acquire(self):
+        # waiters are served in order as they all queue on the lock
+        async with self.lock:
+            while True:
+                now = self.refill()
+                if self.tokens > self.reserve:
+                    self.tokens -= 1
+                    return
+
+                if self.tokens >= 1 and now >= self.next_slot:
+                    interval = (self.window_end - now) / self.tokens
+                    self.tokens -= 1
+                    self.next_slot = now + interval
+                    return
+
+                wait = (self.next_slot if self.tokens >= 1 else self.window_end) - now
+                self.waited += wait
+                await asyncio.sleep(wait)
+
+    def refund(self):
+        # a 304 to a conditional request does not count against the rate limit
+        self.tokens = min(self.tokens + 1, self.limit)
+
+    def pause(self, seconds):
+        # Retry-After, nothing goes out until it has passed
+        self.tokens = 0
+        self.window_end = time.monotonic() + seconds
+
+    def update(self, headers):
+        # X-RateLimit-* of a response is the server's view of what is left
+        if "X-RateLimit-Remaining" not in headers or "X-RateLimit-Reset" not in headers:
+            return
+
+        self.refill()
+        limit = int(headers.get("X-RateLimit-Limit", 0))
+        remaining = int(headers["X-RateLimit-Remaining"])
+        window_end = time.monotonic() + max(float(headers["X-RateLimit-Reset"]) - time.time(), 1.0)
+
+        if limit > 0:
+            self.limit = limit
+            self.reserve = max(int(limit * RESERVE_SHARE), 1)
+
+        # responses come back out of order, within a window the lowest count is the one that holds
+        if window_end > self.window_end + 1:
+            self.tokens = remaining
+        else:
+            self.tokens = min(self.tokens, remaining)
+        self.window_end = window_end
+
+class GithubClient:
+    # one session with pooled keep-alive connections, use with async with
+    def __init__(self, token, base_url=None, record_dir=None):
+        self.token = token
+        self.base_url = base_url if base_url is not None else GITHUB_API
+        # responses are also written as stub recordings when set
+        self.record_dir = record_dir
+        self.session = None
+        self.bucket = None
+        # login -> task fetching the user's email, users review many PRs
+        self.emails = {}
+        self.counters = {"requests": 0, "not_modified": 0, "retries": 0}
+
+    async def __aenter__(self):
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if self.token is not None:
+            headers["Authorization"] = "token " + self.token
+
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT), headers=headers)
+        self.bucket = TokenBucket()
+
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def get(self, url):
+        # (json body, next page url)
+        cached = read_etag(url)
+        headers = {}
+        if cached is not None:
+            headers["If-None-Match"] = cached["etag"]
+
+        for attempt in range(MAX_RETRIES):
+            await self.bucket.acquire()
+            self.counters["requests"] += 1
+
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    # before the headers are read, they do not count it either
+                    self.bucket.refund()
+                self.bucket.update(response.headers)
+
+                if response.status == 304:
+                    self.counters["not_modified"] += 1
+                    return cached["body"], cached["link"]
+
+                if response.status in (403, 429) and (response.headers.get("X-RateLimit-Remaining") == "0"
+                        or "Retry-After" in response.headers):
+                    # the bucket now waits for the window to reset
+                    if "Retry-After" in response.headers:
+                        self.bucket.pause(float(response.headers["Retry-After"]))
+                    self.counters["retries"] += 1
+                    continue
+
+                response.raise_for_status()
+                body = await response.json(content_type=None)
+                link = next_link(response.headers.get("Link"))
+
+                if "ETag" in response.headers:
+                    write_etag(url, {"etag": response.headers["ETag"], "body": body, "link": link})
+                if self.record_dir is not None:
+                    self.record(url, response, body)
+
+                return body, link
+
+        raise aiohttp.ClientError("rate limited " + str(MAX_RETRIES) + " times for " + url)
+
+    def record(self, url, response, body):
+        headers = {name: response.headers[name].replace(self.base_url, BASE_PLACEHOLDER)
+                for name in ["ETag", "Link"] if name in response.headers}
+        write_recording(self.record_dir, url[len(self.base_url):],
+                {"status": response.status, "headers": headers, "body": body})
+
+    async def get_json(self, path):
+        body, _ = await self.get(self.base_url + path)
+        return body
+
+    async def get_pages(self, path):
+        items = []
+        url = self.base_url + path + "?per_page=" + str(PAGE_SIZE)
+        while url is not None:
+            body, url = await self.get(url)
+            items.extend(body)
+
+        return items
+
+    async def user_email(self, user):
+        # deleted accounts have no user
+        if user is None:
+            return None
+
+        login = user["login"]
+        if login not in self.emails:
+            self.emails[login] = asyncio.ensure_future(self.get_json("/users/" + login))
+
+        return (await self.emails[login]).get("email")
+
+    async def repo(self, repo_full_name):
+        g_repo = await self.get_json("/repos/" + repo_full_name)
+        return {"name": g_repo["name"], "clone_url": g_repo["clone_url"]}
+
+    async def pr(self, repo_full_name, pr_id):
+        # the same fields PRMetadata keeps
+        path = "/repos/" + repo_full_name + "/pulls/" + str(pr_id)
+        pr = await self.get_json(path)
+
+        reviewers = []
+        if pr["merged"]:
+            reviews = await self.get_pages(path + "/reviews")
+            reviewers = await asyncio.gather(*[self.user_email(review["user"]) for review in reviews])
+
+        return {"number": pr_id,
+                "merged": pr["merged"],
+                "user": await self.user_email(pr["user"]),
+                "head": pr["head"]["sha"],
+                "merge_commit": pr["merge_commit_sha"],
+                "num_commits": pr["commits"],
+                "reviewers": list(reviewers)}
+
+async def fetch_all(client, repo_full_name, pr_ids, with_repo):
+    limit = asyncio.Semaphore(MAX_CONCURRENT_PRS)
+
+    async def fetch_pr(pr_id):
+        async with limit:
+            try:
+                return pr_id, await client.pr(repo_full_name, pr_id)
+            except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+                print("could not fetch PR", pr_id, e)
+                return pr_id, None
+
+    repo_data = None
+    if with_repo:
+        try:
+            repo_data = await client.repo(repo_full_name)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+            print("could not fetch repo", repo_full_name, e)
+
+    prs = await asyncio.gather(*[fetch_pr(pr_id) for pr_id in pr_ids])
+
+    return repo_data, {pr_id: data for pr_id, data in prs if data is not None}
+
+def fetch_metadata(token, repo_full_name, pr_ids, with_repo=True, base_url=None, record_dir=None):
+    # (repo data, {pr id: pr data}), PRs that could not be fetched are left out
+    async def run():
+        async with GithubClient(token, base_url, record_dir) as client:
+            start = time.time()
+            result = await fetch_all(client, repo_full_name, pr_ids, with_repo)
+            print("fetched", len(result[1]), "of", len(pr_ids), "PRs in", round(time.time() - start, 2), "s,",
+                    client.counters["requests"], "requests,", client.counters["not_modified"], "not modified,",
+                    round(client.bucket.waited, 2), "s waiting for the rate limit")
+            return result
+
+    return asyncio.run(run())
@@ -0,0 +1,154 @@
+#!/bin/python3.8
+# local stand-in for the GitHub API that replays recorded responses, for offline tests and benchmarks
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8081
+RECORDINGS_DIR = "cache/github_recordings/"
+# requests allowed per window, as GitHub does for a token
+RATE_LIMIT = 5000
+RATE_WINDOW = 3600
+# seconds added to every response, stands in for the round trip to GitHub
+LATENCY = 0.0
+
+# recorded urls name the server they came from with this, replaced with the stub's own address
+BASE_PLACEHOLDER = "{base}"
+
+def recording_path(recordings_dir, path):
+    # path includes the query string
+    return os.path.join(recordings_dir, hashlib.sha1(path.encode()).hexdigest() + ".json")
+
+def read_recording(recordings_dir, path):
+    filename = recording_path(recordings_dir, path)
+    if not os.path.isfile(filename):
+        return None
+
+    f = open(filename)
+    recording = json.load(f)
+    f.close()
+
+    return recording
+
+def write_recording(recordings_dir, path, recording):
+    filename = recording_path(recordings_dir, path)
+    os.makedirs(recordings_dir, exist_ok=True)
+
+    tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    f = open(tmp_filename, "w")
+    json.dump(recording, f)
+    f.close()
+    os.replace(tmp_filename, filename)
+
+class RateLimit:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset = time.time() + window
+        self.lock = threading.Lock()
+
+    def take(self):
+        # (allowed, headers) for one request
+        with self.lock:
+            now = time.time()
+            if now >= self.reset:
+                self.remaining = self.limit
+                self.reset = now + self.window
+
+            allowed = self.remaining > 0
+            if allowed:
+                self.remaining -= 1
+
+            return allowed, self.headers()
+
+    def headers(self):
+        return {"X-RateLimit-Limit": str(self.limit), "X-RateLimit-Remaining": str(self.remaining),
+                "X-RateLimit-Reset": str(int(self.reset))}
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive so clients can reuse their connections
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        return
+
+    def send_json(self, status, body, headers):
+        data = json.dumps(body).encode() if body is not None else b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        stub = self.server
+        with stub.counters_lock:
+            stub.counters["requests"] += 1
+
+        if stub.latency > 0:
+            time.sleep(stub.latency)
+
+        recording = read_recording(stub.recordings_dir, self.path)
+        if recording is None:
+            self.send_json(404, {"message": "Not Found"}, {})
+            return
+
+        base = "http://" + self.headers.get("Host", stub.server_name + ":" + str(stub.server_port))
+        headers = {name: value.replace(BASE_PLACEHOLDER, base) for name, value in recording["headers"].items()}
+
+        # conditional requests that match do not count against the rate limit
+        etag = headers.get("ETag")
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            with stub.counters_lock:
+                stub.counters["not_modified"] += 1
+            headers.update(stub.rate_limit.headers())
+            self.send_json(304, None, headers)
+            return
+
+        allowed, rate_headers = stub.rate_limit.take()
+        headers.update(rate_headers)
+        if not allowed:
+            with stub.counters_lock:
+                stub.counters["rate_limited"] += 1
+            self.send_json(403, {"message": "API rate limit exceeded"}, rate_headers)
+            return
+
+        self.send_json(recording["status"], recording["body"], headers)
+
+def make_server(host=STUB_HOST, port=STUB_PORT, recordings_dir=RECORDINGS_DIR, latency=LATENCY,
+        rate_limit=RATE_LIMIT, rate_window=RATE_WINDOW):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.recordings_dir = recordings_dir
+    server.latency = latency
+    server.rate_limit = RateLimit(rate_limit, rate_window)
+    server.counters = {"requests": 0, "not_modified": 0, "rate_limited": 0}
+    server.counters_lock = threading.Lock()
+
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="replay recorded GitHub API responses")
+    parser.add_argument("--host", default=STUB_HOST)
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    parser.add_argument("--latency", type=float, default=LATENCY, help="seconds added to every response")
+    parser.add_argument("--rate-limit", type=int, default=RATE_LIMIT)
+    parser.add_argument("--rate-window", type=int, default=RATE_WINDOW, help="seconds")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.recordings, args.latency, args.rate_limit, args.rate_window)
+    print("replaying", args.recordings, "on", args.host + ":" + str(args.port))
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
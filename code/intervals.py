@@ -0,0 +1,59 @@
+import bisect
+
+def merge_intervals(pairs):
+    # sorted, non overlapping (start, end, None) intervals covering the same lines
+    merged = []
+
+    for start, end in sorted(pairs):
+        if len(merged) > 0 and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end), None)
+        else:
+            merged.append((start, end, None))
+
+    return merged
+
+def author_intervals(author_lines):
+    return [(pair[0], pair[1], author) for author, lines in author_lines.items() for pair in lines]
+
+class IntervalIndex:
+    # (start, end, value) with inclusive line numbers, sorted once by start
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self.starts = [interval[0] for interval in self.intervals]
+
+        # largest end line up to each interval, lets a search stop early
+        self.max_ends = []
+        max_end = None
+        for interval in self.intervals:
+            if max_end is None or interval[1] > max_end:
+                max_end = interval[1]
+            self.max_ends.append(max_end)
+
+    def scan(self, last_start, first_end):
+        # intervals starting at or before last_start and ending at or after first_end
+        i = bisect.bisect_right(self.starts, last_start) - 1
+        while i >= 0 and self.max_ends[i] >= first_end:
+            if self.intervals[i][1] >= first_end:
+                yield self.intervals[i]
+            i -= 1
+
+    def overlapping(self, start, end):
+        return self.scan(end, start)
+
+    def containing(self, start, end):
+        return self.scan(start, end)
+
+    def overlaps(self, start, end):
+        for _ in self.overlapping(start, end):
+            return True
+
+        return False
+
+    def overlap_lengths(self, start, end):
+        lengths = {}
+
+        for interval in self.overlapping(start, end):
+            length = min(interval[1], end) - max(interval[0], start) + 1
+            lengths[interval[2]] = lengths.get(interval[2], 0) + length
+
+        return lengths
@@ -1,101 +1,134 @@
 #!/bin/python
-import json
+import argparse
 import os
-import statistics as s
 
-DIR = "res/"
+import numpy as np
 
-def topk(recomended, correct, k):
-    if k > len(recomended):
-        k = len(recomended)
+from results_sink import read_results
 
-    for i in range(k):
-        if recomended[i][0] in correct:
-            return 1
+RESULTS_FILE = "res/results.jsonl"
 
-    return 0
+# variants written by py_parse, printed first and in this order
+VARIANTS = ["all", "modified", "related", "api"]
+
+TOP_KS = [1, 5, 10]
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_SEED = 0
 
-def MRR(recomended, correct):
+def first_correct_rank(recomended, correct):
+    # 1 based rank of the first correct reviewer, 0 if none was recomended
     for i in range(len(recomended)):
         if recomended[i][0] in correct:
-            return 1/(i+1)
+            return i + 1
 
     return 0
 
-def stats(recomended, correct):
-    top1 = topk(recomended, correct, 1)
-    top5 = topk(recomended, correct, 5)
-    top10 = topk(recomended, correct, 10)
+class Results:
+    # one row per (variant, PR), columns are numpy arrays
+    def __init__(self, variants, prs, ranks, num_recomended):
+        self.variants = variants
+        self.prs = prs
+        self.variant = np.array([variants.index(v) for v in prs["variant"]], dtype=np.int32)
+        self.rank = np.array(ranks, dtype=np.int32)
+        self.num_recomended = np.array(num_recomended, dtype=np.int32)
+
+def load_results(path, run=None):
+    # single pass over the results file, every variant at once, the last run unless one is given
+    records = list(read_results(path))
+    if run is None and len(records) > 0:
+        run = records[-1]["run"]
+
+    variants = []
+    prs = {"variant": [], "name": []}
+    ranks = []
+    num_recomended = []
 
-    mrr = MRR(recomended, correct)
+    for reviews in records:
+        if reviews["run"] != run:
+            continue
 
-    return top1, top5, top10, mrr
+        variant = reviews["variant"]
+        recomended = reviews["recomended"]
+        correct = reviews["correct"][0]
 
-def stats_on_test(test_name):
-    top1s = []
-    top5s = []
-    top10s = []
-    mrrs = []
+        if variant not in variants:
+            variants.append(variant)
+        prs["variant"].append(variant)
+        prs["name"].append(os.path.basename(reviews["repo"]) + str(reviews["pr"]))
+        ranks.append(first_correct_rank(recomended, correct))
+        num_recomended.append(len(recomended))
 
-    num_recomended = []
-    top1_not_found = 0
-    top5_not_found = 0
-    top10_not_found = 0
-    not_in_recomended = 0
-
-    # open files
-    for filename in os.listdir(DIR):
-        if not filename.startswith(test_name):
+    # known variants first so the output keeps its order
+    variants.sort(key=lambda v: (VARIANTS.index(v) if v in VARIANTS else len(VARIANTS), v))
+
+    return Results(variants, prs, ranks, num_recomended)
+
+def hits(rank, ks):
+    # (len(ks), PRs) matrix, 1 where the first correct reviewer is within the top k
+    ks = np.asarray(ks, dtype=np.int32)[:, None]
+    return ((rank[None, :] > 0) & (rank[None, :] <= ks)).astype(np.float64)
+
+def reciprocal_ranks(rank):
+    return np.where(rank > 0, 1.0 / np.maximum(rank, 1), 0.0)
+
+def bootstrap_intervals(values, samples, seed):
+    # 95% intervals of the mean of each row of values, PRs are resampled with replacement
+    n = values.shape[1]
+    rng = np.random.default_rng(seed)
+    # how often each PR is drawn in each resample, so every mean is one matrix product
+    weights = rng.multinomial(n, np.full(n, 1.0 / n), size=samples) / n
+    means = values @ weights.T
+
+    return np.percentile(means, 2.5, axis=1), np.percentile(means, 97.5, axis=1)
+
+def stats(results, ks, samples, seed):
+    # per variant: top k means, mrr, not found counts and bootstrap intervals
+    all_stats = {}
+
+    for i, variant in enumerate(results.variants):
+        rank = results.rank[results.variant == i]
+        if len(rank) == 0:
             continue
 
-        f = open(DIR + filename)
-        reviews = json.load(f)
-        f.close()
+        # rows are top k for every k then mrr
+        values = np.vstack([hits(rank, ks), reciprocal_ranks(rank)[None, :]])
+        low, high = bootstrap_intervals(values, samples, seed)
 
-        recomended = reviews["recomended"]
-        correct = reviews["correct"][0]
+        all_stats[variant] = {
+            "prs": len(rank),
+            "means": values.mean(axis=1),
+            "low": low,
+            "high": high,
+            "not_found": (values == 0).sum(axis=1),
+        }
 
-        num_recomended.append(len(recomended))
+    return all_stats
 
-        # calculate stats
-        top1, top5, top10, mrr = stats(recomended, correct)
-
-        top1s.append(top1)
-        top5s.append(top5)
-        top10s.append(top10)
-        mrrs.append(mrr)
-
-        if top1 == 0:
-            top1_not_found += 1
-        if top5 == 0:
-            top5_not_found += 1
-        if top10 == 0:
-            top10_not_found += 1
-        if mrr == 0:
-            not_in_recomended += 1
-
-    top1mean = s.mean(top1s)
-    top5mean = s.mean(top5s)
-    top10mean = s.mean(top10s)
-    mrrmean = s.mean(mrrs)
-
-    print(test_name, "top1,", top1mean)
-    print(test_name, "top5,", top5mean)
-    print(test_name, "top10,", top10mean)
-    print(test_name, "mmr,", mrrmean)
-
-    print(test_name, "top1 not found,", top1_not_found)
-    print(test_name, "top5 not found,", top5_not_found)
-    print(test_name, "top10 not found,", top10_not_found)
-    print(test_name, "not in recomended,", not_in_recomended)
+def print_stats(all_stats, ks):
+    names = ["top" + str(k) for k in ks] + ["mmr"]
 
-def main():
-    if not os.path.exists(DIR):
-        os.makedirs(DIR)
+    for variant, variant_stats in all_stats.items():
+        for name, mean in zip(names, variant_stats["means"]):
+            print(variant, name + ",", mean)
 
-    stats_on_test("all")
-    stats_on_test("modified")
-    stats_on_test("related")
-    stats_on_test("api")
+        for name, count in zip(names[:-1], variant_stats["not_found"]):
+            print(variant, name, "not found,", count)
+        print(variant, "not in recomended,", variant_stats["not_found"][-1])
 
-main()
+        for name, low, high in zip(names, variant_stats["low"], variant_stats["high"]):
+            print(variant, name, "95% ci,", low, high)
+
+def main():
+    parser = argparse.ArgumentParser(description="summarise the reviewer recommendation results")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--run", help="run to summarise, the last one by default")
+    parser.add_argument("-k", type=int, nargs="+", default=TOP_KS, help="top k values to report")
+    parser.add_argument("--samples", type=int, default=BOOTSTRAP_SAMPLES, help="bootstrap resamples")
+    parser.add_argument("--seed", type=int, default=BOOTSTRAP_SEED)
+    args = parser.parse_args()
+
+    results = load_results(args.results, args.run)
+    print_stats(stats(results, args.k, args.samples, args.seed), args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import json
+import os
+import subprocess
+
+from github_client import fetch_metadata
+
+PR_CACHE_DIR = "cache/prs/"
+
+def cache_path(repo_full_name, name):
+    return os.path.join(PR_CACHE_DIR, repo_full_name.replace("/", "_"), name + ".json")
+
+def read_cache(repo_full_name, name):
+    filename = cache_path(repo_full_name, name)
+    if not os.path.isfile(filename):
+        return None
+
+    f = open(filename)
+    data = json.load(f)
+    f.close()
+
+    return data
+
+def write_cache(repo_full_name, name, data):
+    filename = cache_path(repo_full_name, name)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    # written to a temporary file first so a killed run never leaves half a file
+    tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    f = open(tmp_filename, "w")
+    json.dump(data, f)
+    f.close()
+    os.replace(tmp_filename, filename)
+
+def get_pr_reviewers(pr):
+    return [review.user.email for review in pr.get_reviews()]
+
+class PRMetadata:
+    # github metadata read once and kept on disk, github_access is None when offline
+    def __init__(self, repo_full_name, github_access):
+        self.repo_full_name = repo_full_name
+        self.github_access = github_access
+        self.g_repo = None
+
+    def github_repo(self):
+        if self.g_repo is None:
+            self.g_repo = self.github_access.get_repo(self.repo_full_name)
+
+        return self.g_repo
+
+    def repo(self):
+        data = read_cache(self.repo_full_name, "repo")
+        if data is None and self.github_access is not None:
+            g_repo = self.github_repo()
+            data = {"name": g_repo.name, "clone_url": g_repo.clone_url}
+            write_cache(self.repo_full_name, "repo", data)
+
+        return data
+
+    def prefetch(self, pr_ids, token):
+        # PRs missing from the cache are fetched concurrently, pr() falls back to PyGithub for any that failed
+        missing = [pr_id for pr_id in pr_ids if read_cache(self.repo_full_name, str(pr_id)) is None]
+        with_repo = read_cache(self.repo_full_name, "repo") is None
+        if len(missing) == 0 and not with_repo:
+            return
+
+        repo_data, prs = fetch_metadata(token, self.repo_full_name, missing, with_repo)
+        if repo_data is not None:
+            write_cache(self.repo_full_name, "repo", repo_data)
+        for pr_id, data in prs.items():
+            write_cache(self.repo_full_name, str(pr_id), data)
+
+    def pr(self, pr_id):
+        data = read_cache(self.repo_full_name, str(pr_id))
+        if data is None and self.github_access is not None:
+            pr = self.github_repo().get_pull(pr_id)
+            data = {"number": pr_id,
+                    "merged": pr.merged,
+                    "user": pr.user.email,
+                    "head": pr.head.sha,
+                    "merge_commit": pr.merge_commit_sha,
+                    "num_commits": pr.commits,
+                    "reviewers": get_pr_reviewers(pr) if pr.merged else []}
+            write_cache(self.repo_full_name, str(pr_id), data)
+
+        return data
+
+def git(repo_path, args):
+    return subprocess.run(["git", "-C", repo_path] + args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True)
+
+def has_commit(repo_path, sha):
+    return git(repo_path, ["cat-file", "-e", sha + "^{commit}"]).returncode == 0
+
+def fetch_pr_head(repo_path, pr_id):
+    git(repo_path, ["fetch", "-q", "origin", "pull/" + str(pr_id) + "/head"])
+
+def get_base_commit(repo_path, pr_data, offline):
+    # the commit the PR branched from, found in the local clone
+    head = pr_data["head"]
+    merge_commit = pr_data["merge_commit"]
+
+    if not has_commit(repo_path, head) and not offline:
+        fetch_pr_head(repo_path, pr_data["number"])
+
+    if merge_commit is None or not has_commit(repo_path, head) or not has_commit(repo_path, merge_commit):
+        return None
+
+    # only PRs whose commits made it into the main history, squashed PRs have no matching base
+    if git(repo_path, ["merge-base", "--is-ancestor", head, merge_commit]).returncode != 0:
+        return None
+
+    base = head
+    if merge_commit != head:
+        base = git(repo_path, ["merge-base", merge_commit + "^1", head]).stdout.strip()
+        if base == "":
+            return None
+
+    if base == head:
+        # fast forwarded or rebased, the PR's commits sit on the first parent line
+        base = git(repo_path, ["rev-parse", "--verify", "-q",
+                head + "~" + str(pr_data["num_commits"])]).stdout.strip()
+
+    return base if base != "" else None
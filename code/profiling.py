@@ -0,0 +1,137 @@
+import cProfile
+import functools
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# directory to dump a cProfile of every profiled run into, None to skip
+CPROFILE_DIR = None
+
+class Profile:
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.counters = {}
+        self.start_wall = time.time()
+        self.start_cpu = process_times()
+        self.end_wall = None
+        self.end_cpu = None
+        self.end_max_rss = None
+        self.profiler = None
+
+    def add_stage(self, stage, wall, cpu, child_cpu):
+        totals = self.stages.setdefault(stage, {"calls": 0, "wall": 0.0, "cpu": 0.0, "child_cpu": 0.0})
+        totals["calls"] += 1
+        totals["wall"] += wall
+        totals["cpu"] += cpu
+        totals["child_cpu"] += child_cpu
+
+    def report(self):
+        end_wall = self.end_wall if self.end_wall is not None else time.time()
+        end_cpu = self.end_cpu if self.end_cpu is not None else process_times()
+
+        return {"name": self.name,
+                "wall": end_wall - self.start_wall,
+                "cpu": end_cpu[0] - self.start_cpu[0],
+                "child_cpu": end_cpu[1] - self.start_cpu[1],
+                "max_rss_kb": self.end_max_rss if self.end_max_rss is not None else max_rss_kb(),
+                "stages": self.stages,
+                "counters": self.counters}
+
+def max_rss_kb():
+    # high water mark of this process's resident memory since it started
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def process_times():
+    # cpu of this process and of the git and parse processes it has waited for
+    times = os.times()
+    return time.process_time(), times.children_user + times.children_system
+
+# the run being profiled, stages and counts are dropped while it is None
+current = None
+# blame threads count cache hits at the same time
+counters_lock = threading.Lock()
+
+def start(name):
+    global current
+    current = Profile(name)
+
+    if CPROFILE_DIR is not None:
+        current.profiler = cProfile.Profile()
+        current.profiler.enable()
+
+    return current
+
+def stop():
+    global current
+    profile = current
+    current = None
+
+    if profile is not None:
+        if profile.profiler is not None:
+            profile.profiler.disable()
+        profile.end_wall = time.time()
+        profile.end_cpu = process_times()
+        profile.end_max_rss = max_rss_kb()
+
+    return profile
+
+@contextmanager
+def stage(name):
+    profile = current
+    if profile is None:
+        yield
+        return
+
+    start_wall = time.time()
+    start_cpu = process_times()
+    try:
+        yield
+    finally:
+        end_cpu = process_times()
+        profile.add_stage(name, time.time() - start_wall, end_cpu[0] - start_cpu[0], end_cpu[1] - start_cpu[1])
+
+def timed(name):
+    # decorator form of stage
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, n=1):
+    profile = current
+    if profile is None:
+        return
+
+    with counters_lock:
+        profile.counters[name] = profile.counters.get(name, 0) + n
+
+def high_water(name, value):
+    # counter keeping the largest value seen
+    profile = current
+    if profile is None:
+        return
+
+    with counters_lock:
+        profile.counters[name] = max(profile.counters.get(name, value), value)
+
+def write(profile, path):
+    # json report, and the cProfile stats next to it when enabled
+    directory = os.path.dirname(path)
+    if directory != "" and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    f = open(path, "w")
+    json.dump(profile.report(), f, indent=2)
+    f.close()
+
+    if profile.profiler is not None:
+        if not os.path.isdir(CPROFILE_DIR):
+            os.makedirs(CPROFILE_DIR)
+        profile.profiler.dump_stats(os.path.join(CPROFILE_DIR, profile.name + ".prof"))
@@ -1,14 +1,60 @@
 #!/bin/python3.8
 import ast
-import pg8000
 import pydriller
 import os
 from github import Github
 from git import Repo
 import json
+import profiling
+import sparse_rank
+import fact_cache
+import argparse
+import multiprocessing
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fact_writer import FactWriter
+from blame import blame_files
+from blame_carry import carry_author_lines
+from git_objects import open_git_objects
+from diffs import iter_diff, changed_lines
+from intervals import IntervalIndex, merge_intervals, author_intervals
+from storage import connect_storage, CHANGE_TABLES, STREAM_CHUNK_ROWS
+from pr_metadata import PRMetadata, get_base_commit
+from results_sink import ResultsSink
 
 REPOS_DIR = "repos/"
 RESULT_DIR = "res/"
+# stage timings and counters of each evaluated PR
+PROFILE_DIR = RESULT_DIR + "profiles/"
+RESULTS_FILE = RESULT_DIR + "results.jsonl"
+
+# "postgres" to use the review-psql database, "memory" to rank without a database
+STORAGE = "postgres"
+
+# only use cached github metadata and local clones, nothing is fetched
+OFFLINE = False
+
+# "checkout" parses the working tree after git checkout, "objects" reads files
+# straight from the git object database without touching the working tree
+SOURCE = "checkout"
+
+# "sql" runs the score queries in storage, "sparse" multiplies cached contributor x entity ownership
+# matrices by the PR's changes
+RANK_ENGINE = "sql"
+
+# processes used to parse files, 1 parses in this process
+PARSE_WORKERS = os.cpu_count() or 1
+# files handed to a parse worker at a time
+PARSE_CHUNK_SIZE = 16
+# git blame processes run at once
+BLAME_WORKERS = os.cpu_count() or 1
+# move the last snapshot's line ownership through the new commits' diffs instead of blaming changed files again
+CARRY_BLAME = True
+# PRs evaluated at once, each in its own worktree with its own storage
+JOBS = 1
+# consecutive PRs handed to an evaluation worker at a time so its snapshot is updated rather than rebuilt
+JOB_CHUNK_SIZE = 4
+WORKTREES_DIR = REPOS_DIR + "worktrees/"
 
 MODIFIED_STR = "modified"
 RELATED_STR = "related"
@@ -16,33 +62,32 @@ API_STR = "api"
 
 metrics_in_use = [MODIFIED_STR, RELATED_STR, API_STR]
 
+# test name -> metrics combined for it, every variant is ranked from the same scores
+VARIANTS = {
+    "all": [MODIFIED_STR, RELATED_STR, API_STR],
+    MODIFIED_STR: [MODIFIED_STR],
+    RELATED_STR: [RELATED_STR],
+    API_STR: [API_STR],
+}
+
 def trim_filename(filename):
     return filename[:-3]
 
-def check_overlap(start1, end1, start2, end2):
-    return len(range(max([start1, start2]), min([end1, end2]) + 1))
-
 class Visitor(ast.NodeVisitor):
-    def __init__(self, filepath, filename, conn, lines, old_filepath, old_filename):
+    def __init__(self, filepath, filename, writer, lines, old_filepath, old_filename):
         self.filename = filename
         self.filepath = filepath
-        self.conn = conn
+        self.writer = writer
         self.import_name = trim_filename(filename)
         self.import_mappings = {}
         self.lines = lines
+        self.changed_lines = IntervalIndex(merge_intervals(lines))
         self.old_filepath = old_filepath
         self.old_filename = old_filename
         return
 
     def check_lines_overlap(self, start_lineno, end_lineno):
-        for pair in self.lines:
-            start = pair[0]
-            end = pair[1]
-
-            if check_overlap(start, end, start_lineno, end_lineno) != 0:
-                return True
-
-        return False
+        return self.changed_lines.overlaps(start_lineno, end_lineno)
 
     def clean_import_names(self, name):
         return name.split(".")[-1]
@@ -73,34 +118,18 @@ class Visitor(ast.NodeVisitor):
     def visit_FunctionDef(self, node):
         # check lines
         if len(self.lines) == 0:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO functions (filename, filepath, name, start_line, end_line) VALUES (%s, %s, %s, %s, %s)",
-                    (self.filename, self.filepath, node.name, node.lineno, node.end_lineno))
-            self.conn.commit()
-            c.close()
+            self.writer.add("functions", (self.filename, self.filepath, node.name, node.lineno, node.end_lineno))
         elif self.check_lines_overlap(node.lineno, node.end_lineno):
-            c = self.conn.cursor()
-            c.execute("INSERT INTO modified_funcs (filename, filepath, name) VALUES (%s, %s, %s)",
-                    (self.old_filename, self.old_filepath, node.name))
-            self.conn.commit()
-            c.close()
+            self.writer.add("modified_funcs", (self.old_filename, self.old_filepath, node.name))
 
         self.generic_visit(node)
 
     def visit_AsyncFunctionDef(self, node):
         # check lines
         if len(self.lines) == 0:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO functions (filename, filepath, name, start_line, end_line) VALUES (%s, %s, %s, %s, %s)",
-                    (self.filename, self.filepath, node.name, node.lineno, node.end_lineno))
-            self.conn.commit()
-            c.close()
+            self.writer.add("functions", (self.filename, self.filepath, node.name, node.lineno, node.end_lineno))
         elif self.check_lines_overlap(node.lineno, node.end_lineno):
-            c = self.conn.cursor()
-            c.execute("INSERT INTO modified_funcs (filename, filepath, name) VALUES (%s, %s, %s)",
-                    (self.old_filename, self.old_filepath, node.name))
-            self.conn.commit()
-            c.close()
+            self.writer.add("modified_funcs", (self.old_filename, self.old_filepath, node.name))
 
         self.generic_visit(node)
 
@@ -138,46 +167,30 @@ class Visitor(ast.NodeVisitor):
         if base in self.import_mappings:
             base = self.import_mappings[base]
 
-        # add to db
+        # add to writer
 
         if len(self.lines) == 0:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO func_call (filename, filepath, base_name, name, start_line, end_line) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (self.filename, self.filepath, base, func_name, node.lineno, node.end_lineno))
-            self.conn.commit()
-            c.close()
+            self.writer.add("func_call", (self.filename, self.filepath, base, func_name, node.lineno, node.end_lineno))
         elif self.check_lines_overlap(node.lineno, node.end_lineno):
-            c = self.conn.cursor()
-            c.execute("INSERT INTO modified_func_calls (base_name, name, counts) VALUES (%s, %s, %s)"
-                    + "ON CONFLICT (base_name, name) DO UPDATE SET counts = modified_func_calls.counts + (%s)",
-                    (base, func_name, 1, 1, ))
-            self.conn.commit()
-            c.close()
+            self.writer.add_modified_call(base, func_name)
 
         self.generic_visit(node)
 
     def visit_ClassDef(self, node):
         # check lines
-        # add to db
+        # add to writer
 
         if len(self.lines) == 0:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO classes (filename, filepath, name, start_line, end_line) VALUES (%s, %s, %s, %s, %s)",
-                    (self.filename, self.filepath, node.name, node.lineno, node.end_lineno))
-            self.conn.commit()
-            c.close()
+            self.writer.add("classes", (self.filename, self.filepath, node.name, node.lineno, node.end_lineno))
         else:
             if self.check_lines_overlap(node.lineno, node.end_lineno):
-                c = self.conn.cursor()
-                c.execute("INSERT INTO modified_classes (filename, filepath, name) VALUES (%s, %s, %s)",
-                        (self.old_filename, self.old_filepath, node.name))
-                self.conn.commit()
-                c.close()
+                self.writer.add("modified_classes", (self.old_filename, self.old_filepath, node.name))
 
         self.generic_visit(node)
 
-def process_file(filepath, repopath, filename, conn, lines, old_repopath, old_filename):
-    if not os.path.isfile(filepath):
+def process_file(filepath, repopath, filename, writer, lines, old_repopath, old_filename, source=None):
+    # source is only None when the file is read from the working tree
+    if source is None and not os.path.isfile(filepath):
         print("file", filepath, "does not exist")
         return
 
@@ -186,111 +199,143 @@ def process_file(filepath, repopath, filename, conn, lines, old_repopath, old_fi
 
     print("processing", filepath)
 
-    f = open(filepath)
-
-    a = ast.parse(f.read(), filename=filename)
+    if source is None:
+        f = open(filepath)
+        source = f.read()
+        f.close()
 
-    f.close()
+    a = ast.parse(source, filename=filename)
 
-    visitor = Visitor(repopath, filename, conn, lines, old_repopath, old_filename)
+    visitor = Visitor(repopath, filename, writer, lines, old_repopath, old_filename)
 
     visitor.visit(a)
 
-def find_inner_func(conn, filename, start_line, end_line):
-    # results may be greater than one if multiple files have the same name
+def read_source(git_dir, filename, object_name):
+    # python files from the git object database, None if the object does not exist
+    if not filename.endswith(".py"):
+        return b""
 
-    c = conn.cursor()
-    rows = c.execute("SELECT * FROM functions where filename = (%s) and start_line <= (%s) and end_line >= (%s)",
-            (filename, start_line, end_line, ))
-    keys = [k[0].decode('ascii') for k in c.description]
-    results = [dict(zip(keys, row)) for row in rows]
-    c.close()
+    return open_git_objects(git_dir).read(object_name)
 
-    return results
+def extract_file(file_obj):
+    # run in worker processes so only plain rows are returned
+    writer = FactWriter(None)
 
-def find_func(conn, base_name, func_name):
-    filename = base_name + ".py"
+    source = None
+    if "blob" in file_obj:
+        source = read_source(file_obj["git_dir"], file_obj["name"], file_obj["blob"])
 
-    c = conn.cursor()
-    rows = c.execute("SELECT * FROM functions where filename = (%s) and name = (%s)",
-            (filename, func_name, ))
-    keys = [k[0].decode('ascii') for k in c.description]
-    results = [dict(zip(keys, row)) for row in rows]
-    c.close()
+    try:
+        process_file(file_obj["path"], file_obj["repopath"], file_obj["name"], writer, [],
+                file_obj["path"], file_obj["name"], source)
+    except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+        return file_obj["repopath"], None, e
 
-    return results
+    return file_obj["repopath"], writer.rows, None
+
+def file_blob(file_obj):
+    # the blob sha the file's contents hash to, None if it is not in the commit
+    return file_obj.get("blob", file_obj.get("sha"))
+
+def cached_facts(file_obj):
+    # extracted facts depend only on the blob and the module name, not on the commit or fork
+    if file_blob(file_obj) is None:
+        return None
+
+    facts = fact_cache.read_facts(file_blob(file_obj), file_obj["name"], file_obj["repopath"])
+    if facts is None:
+        return None
+
+    rows, error = facts
+    return file_obj["repopath"], rows, error
+
+def extract_files(files, workers):
+    if workers <= 1 or len(files) <= 1:
+        return map(extract_file, files)
+
+    # map keeps the order of files so function ids do not depend on worker timing
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(extract_file, files, chunksize=PARSE_CHUNK_SIZE))
+
+class FuncIndex:
+    def __init__(self, funcs):
+        # ids by (filename, name) for called functions
+        self.by_name = {}
+        # spans per filename for enclosing functions
+        spans = {}
+
+        for f in funcs:
+            self.by_name.setdefault((f["filename"], f["name"]), []).append(f["id"])
+            spans.setdefault(f["filename"], []).append((f["start_line"], f["end_line"], f["id"]))
+
+        self.spans = {filename: IntervalIndex(intervals) for filename, intervals in spans.items()}
 
-def handle_related_funcs(conn):
-    # map func calls to functions
-    c = conn.cursor()
-    rows = c.execute("SELECT * FROM func_call",)
-    keys = [k[0].decode('ascii') for k in c.description]
-    results = [dict(zip(keys, row)) for row in rows]
-    c.close()
+    def find_inner_funcs(self, filename, start_line, end_line):
+        # results may be greater than one if multiple files have the same name
+        if filename not in self.spans:
+            return []
 
-    for res in results:
+        return [span[2] for span in self.spans[filename].containing(start_line, end_line)]
+
+    def find_funcs(self, base_name, func_name):
+        return self.by_name.get((base_name + ".py", func_name), [])
+
+@profiling.timed("related_funcs")
+def handle_related_funcs(db):
+    # map func calls to functions with one read of each table, calls are streamed in chunks
+    index = FuncIndex(db.stream_rows("functions"))
+
+    pairs = []
+    num_calls = 0
+    for res in db.stream_rows("func_call"):
+        num_calls += 1
         # Threat to validity dont properly check which file the functions are apart of if both files have the same name and func name
         # Threat to validity dont handle functions that are part of a class differenty from a class
 
         # find func it is in
-        callers = find_inner_func(conn, res["filename"], res["start_line"], res["end_line"])
+        callers = index.find_inner_funcs(res["filename"], res["start_line"], res["end_line"])
 
         # find func location
-        funcs = find_func(conn, res["base_name"], res["name"])
-
-        # if funcs and callers exist match in related_funcs
-        if len(callers) > 0 and len(funcs) > 0:
-            # combine
-            for caller in callers:
-                for func in funcs:
-                    c = conn.cursor()
-                    c.execute("INSERT INTO related_funcs (caller_id, called_id) VALUES (%s, %s)",
-                            (caller["id"], func["id"], ))
-                    conn.commit()
-                    c.close()
-
-def get_author_file_ownership(file_obj, branch, repo):
-    # check if file exists
-    if not os.path.isfile(file_obj["path"]):
-        return {}
-    # blame file if blame fails the file is not in the commit
-    try:
-        lines = repo.repo.blame(branch, file_obj["repopath"])
-    except:
-        return {}
+        funcs = index.find_funcs(res["base_name"], res["name"])
 
-    author_lines = {}
-    cur_line = 1
+        # combine, empty if either is missing
+        for caller in callers:
+            for func in funcs:
+                pairs.append((caller, func))
 
-    last_author = None
+        # written as they are found so at most a chunk of pairs is held, committed once the calls are read
+        if len(pairs) >= STREAM_CHUNK_ROWS:
+            db.insert_rows("related_funcs", ("caller_id", "called_id"), pairs)
+            pairs = []
 
-    # process lines
-    for commit, line in lines:
-        email = commit.author.email
-        if commit.author.email not in author_lines:
-            author_lines[email] = []
+    db.insert_rows("related_funcs", ("caller_id", "called_id"), pairs)
+    db.commit()
 
-        if email == last_author:
-            author_lines[email][-1] = (author_lines[email][-1][0], cur_line + len(line) - 1)
-        else:
-            author_lines[email].append((cur_line, cur_line + len(line) - 1))
+    print(num_calls, "calls read in chunks of", STREAM_CHUNK_ROWS, "rows, peak memory",
+            profiling.max_rss_kb(), "KB")
 
-        last_author = email
-        cur_line += len(line)
+def get_author_file_ownership(files, commit, repo, carried=None):
+    # check if file exists, blame runs in a thread pool and results come back in order
+    files = [f for f in files if "blob" in f or os.path.isfile(f["path"])]
 
-    return author_lines
+    # files carried forward from the last snapshot are not blamed
+    if carried is None:
+        carried = {}
+    for f in files:
+        if f["repopath"] in carried:
+            yield f, carried[f["repopath"]]
+
+    files = [f for f in files if f["repopath"] not in carried]
+    blames = blame_files(str(repo.path), commit, [f["repopath"] for f in files], BLAME_WORKERS)
+
+    for f, (_, author_lines) in zip(files, blames):
+        yield f, author_lines
 
-def insert_author_lines(repopath, author_lines, conn):
-    for author, lines in author_lines.items():
-        for pair in lines:
-            # insert into db
-            c = conn.cursor()
-            c.execute("INSERT INTO contributor_ownership (contributor, filepath, start_line, end_line) VALUES (%s, %s, %s, %s)",
-                    (author, repopath, pair[0], pair[1], ))
-            conn.commit()
-            c.close()
-
-def assign_file_ownership(file_obj, conn, author_lines):
+def insert_author_lines(repopath, author_lines, db):
+    rows = [(author, repopath, pair[0], pair[1]) for author, lines in author_lines.items() for pair in lines]
+    db.insert_rows("contributor_ownership", ("contributor", "filepath", "start_line", "end_line"), rows)
+
+def assign_file_ownership(file_obj, db, author_lines):
     owned_lines = {}
 
     for email, pairs in author_lines.items():
@@ -300,253 +345,283 @@ def assign_file_ownership(file_obj, conn, author_lines):
 
     size = sum(s for s in owned_lines.values())
 
-    for email, num_lines in owned_lines.items():
-        c = conn.cursor()
-        c.execute("INSERT INTO file_ownership (contributor, file_path, ownership) VALUES (%s, %s, %s)",
-                (email, file_obj["repopath"], num_lines/size, ))
-        conn.commit()
-        c.close()
-
-def author_ownership(start, end, author_lines):
-    ownership = {author: 0 for author in author_lines.keys()}
-
-    for author, lines in author_lines.items():
-        for pair in lines:
-            ownership[author] += check_overlap(pair[0], pair[1], start, end)
+    rows = [(email, file_obj["repopath"], num_lines/size) for email, num_lines in owned_lines.items()]
+    db.insert_rows("file_ownership", ("contributor", "file_path", "ownership"), rows)
 
-    return ownership
+def author_ownership(start, end, owners):
+    # lines owned by each author that overlap start to end
+    return owners.overlap_lengths(start, end)
 
-def assign_func_ownership(db_func, conn, author_lines):
-    ownership = author_ownership(db_func["start_line"], db_func["end_line"], author_lines)
-
-    size = db_func["end_line"] - db_func["start_line"] + 1
+def assign_api_ownership(db_func_call, api_counts, owners):
+    ownership = author_ownership(db_func_call["start_line"], db_func_call["end_line"], owners)
 
     for author, num_lines in ownership.items():
         if num_lines != 0:
-            c = conn.cursor()
-            c.execute("INSERT INTO func_ownership (contributor, func_id, ownership) VALUES (%s, %s, %s)",
-                    (author, db_func["id"], num_lines/size, ))
-            conn.commit()
-            c.close()
-
-def assign_file_funcs_ownership(file_obj, conn, author_lines):
-    # get all funcs
-    c = conn.cursor()
-    rows = c.execute("SELECT * FROM functions where filepath = (%s)", (file_obj["repopath"], ))
-    keys = [k[0].decode('ascii') for k in c.description]
-    results = [dict(zip(keys, row)) for row in rows]
-    c.close()
+            key = (author, db_func_call["base_name"], db_func_call["name"], db_func_call["filepath"])
+            api_counts[key] = api_counts.get(key, 0) + 1
 
-    # for each func assign ownership
-    for func in results:
-        assign_func_ownership(func, conn, author_lines)
-
-def assign_class_ownership(db_class, conn, author_lines):
-    ownership = author_ownership(db_class["start_line"], db_class["end_line"], author_lines)
-
-    size = db_class["end_line"] - db_class["start_line"] + 1
+def assign_file_api_ownership(file_obj, db, owners):
+    # threat std lib functions appear to be file specific
+    # for each func assign ownership, summed per key so it can be upserted in one go
+    api_counts = {}
+    for c in db.stream_rows("func_call", filepath=file_obj["repopath"]):
+        assign_api_ownership(c, api_counts, owners)
 
-    for author, num_lines in ownership.items():
-        if num_lines != 0:
-            c = conn.cursor()
-            c.execute("INSERT INTO class_ownership (contributor, class_id, ownership) VALUES (%s, %s, %s)",
-                    (author, db_class["id"], num_lines/size, ))
-            conn.commit()
-            c.close()
-
-def assign_file_class_ownership(file_obj, conn, author_lines):
-    # get all classes
-    c = conn.cursor()
-    rows = c.execute("SELECT * FROM classes where filepath = (%s)", (file_obj["repopath"], ))
-    keys = [k[0].decode('ascii') for k in c.description]
-    results = [dict(zip(keys, row)) for row in rows]
-    c.close()
-
-    # for each class assign ownership
-    for c in results:
-        assign_class_ownership(c, conn, author_lines)
-
-def assign_api_ownership(db_func_call, conn, author_lines):
-    ownership = author_ownership(db_func_call["start_line"], db_func_call["end_line"], author_lines)
+    rows = [key + (count, ) for key, count in api_counts.items()]
+    db.add_counts("api_ownership", ("contributor", "base", "name", "filepath"), rows)
 
-    for author, num_lines in ownership.items():
-        if num_lines != 0:
-            c = conn.cursor()
-            # upsert
-            c.execute("INSERT INTO api_ownership (contributor, base, name, counts) VALUES (%s, %s, %s, %s)"
-                    + "ON CONFLICT (contributor, base, name) DO UPDATE SET counts = api_ownership.counts + (%s)",
-                    (author, db_func_call["base_name"], db_func_call["name"], 1, 1, ))
-            conn.commit()
-            c.close()
-
-def assign_file_api_ownership(file_obj, conn, author_lines):
-    # threat std lib functions appear to be file specific
-    c = conn.cursor()
-    rows = c.execute("SELECT * FROM func_call WHERE filepath = (%s)",
-            (file_obj["repopath"],))
-    keys = [k[0].decode('ascii') for k in c.description]
-    results = [dict(zip(keys, row)) for row in rows]
-    c.close()
-
-    # for each func assign ownership
-    for c in results:
-        assign_api_ownership(c, conn, author_lines)
-
-def assign_ownership(file_obj, branch, repo, conn):
-    author_lines = get_author_file_ownership(file_obj, branch, repo)
+@profiling.timed("assign_ownership")
+def assign_ownership(file_obj, author_lines, db):
     if author_lines == {}:
         return
     # done so we can use it later
-    insert_author_lines(file_obj["repopath"], author_lines, conn)
+    insert_author_lines(file_obj["repopath"], author_lines, db)
 
     # file ownership
-    assign_file_ownership(file_obj, conn, author_lines)
-    # func ownership
-    assign_file_funcs_ownership(file_obj, conn, author_lines)
-    # class ownership
-    assign_file_class_ownership(file_obj, conn, author_lines)
+    assign_file_ownership(file_obj, db, author_lines)
+
+    # sorted once and shared by every call in the file, function and class ownership is set based
+    owners = IntervalIndex(author_intervals(author_lines))
     # api ownership
-    assign_file_api_ownership(file_obj, conn, author_lines)
+    assign_file_api_ownership(file_obj, db, owners)
+
+    db.commit()
 
-def get_repo_files(repo):
+def get_repo_files(repo, commit):
+    if SOURCE == "objects":
+        # list the commit's blobs instead of walking the working tree
+        git_dir = str(repo.path)
+        return [{"path": git_dir + "/" + path, "repopath": path, "name": os.path.basename(path),
+                "blob": blob, "git_dir": git_dir}
+                for path, blob in open_git_objects(git_dir).list_files(commit)
+                if path.endswith(".py")]
+
+    # only python files can be changed by a PR's diff so other files are not parsed or blamed
     path_len = len(str(repo.path))
-    return [{"path": f, "repopath": f[path_len + 1: ], "name": os.path.basename(f[path_len + 1: ])}
-            for f in repo.files()]
+    files = [{"path": f, "repopath": f[path_len + 1: ], "name": os.path.basename(f[path_len + 1: ])}
+            for f in repo.files() if f.endswith(".py")]
+
+    # the checked out files are the commit's blobs, untracked files have none and are never cached
+    blobs = dict(open_git_objects(str(repo.path)).list_files(commit))
+    for f in files:
+        if f["repopath"] in blobs:
+            f["sha"] = blobs[f["repopath"]]
+
+    return files
 
 def change_repo_commit(repo, commit):
+    # nothing to check out when files are read from the object database
+    if SOURCE == "objects":
+        return
+
     #repo.repo.git.checkout("master")
     repo.repo.git.checkout(commit)
     # get branch and return
 
-def parse_repo(repo, conn, commit):
-    change_repo_commit(repo, commit)
-
-    files = get_repo_files(repo)
+@profiling.timed("extract")
+def extract_facts(db, files, workers=None):
+    if workers is None:
+        workers = PARSE_WORKERS
 
     num_files = len(files)
 
+    # only blobs that were never parsed before go to the parser
+    cached = [cached_facts(f) for f in files]
+    parsed = iter(extract_files([f for f, facts in zip(files, cached) if facts is None], workers))
+    print("fact cache:", num_files - cached.count(None), "hits,", cached.count(None), "misses")
+
     # parse python files
+    writer = FactWriter(db)
     i = 1
-    for f in files:
+    for f, facts in zip(files, cached):
+        if facts is None:
+            repopath, rows, error = next(parsed)
+            if file_blob(f) is not None:
+                fact_cache.write_facts(file_blob(f), f["name"], rows, error)
+        else:
+            repopath, rows, error = facts
+
         print("file", i, "out of", num_files)
-        process_file(f["path"], f["repopath"], f["name"], conn, [], f["path"], f["name"])
+        if error is not None:
+            print("could not parse", repopath, error)
+            profiling.count("parse_errors")
+        else:
+            writer.extend(rows)
+            profiling.count("files_parsed")
         i += 1
+    writer.flush()
 
-    print("handling related functions")
-    handle_related_funcs(conn)
+@profiling.timed("ownership")
+def assign_files_ownership(repo, db, commit, files, carried=None):
+    num_files = len(files)
 
-    # assign ownership
-    print("assigning file ownership")
     i = 1
-    for f in files:
+    for f, author_lines in get_author_file_ownership(files, commit, repo, carried):
         print("file", i, "of", num_files, f)
-        assign_ownership(f, 'master', repo, conn)
+        profiling.count("files_blamed")
+        assign_ownership(f, author_lines, db)
         i += 1
 
-def get_contributors(conn):
-    c = conn.cursor()
-    rows = c.execute("SELECT DISTINCT contributor FROM contributor_ownership", ())
-    results = {row[0]:{"affected":0, "related":0, "API":0} for row in rows}
-    c.close()
+    # func and class ownership for every file at once from the stored line ranges
+    with profiling.stage("entity_ownership"):
+        db.assign_entity_ownership([f["repopath"] for f in files])
+        db.commit()
 
-    return results
+    # per entity ownership used by the rank queries
+    db.refresh_rollups()
+
+def parse_files(repo, db, commit, files, workers=None, carried=None):
+    extract_facts(db, files, workers)
+
+    print("handling related functions")
+    handle_related_funcs(db)
+
+    # assign ownership
+    print("assigning file ownership")
+    assign_files_ownership(repo, db, commit, files, carried)
+
+@profiling.timed("parse_repo")
+def parse_repo(repo, db, commit):
+    change_repo_commit(repo, commit)
+
+    parse_files(repo, db, commit, get_repo_files(repo, commit))
+
+def stored_author_lines(db, path):
+    author_lines = {}
+    for row in db.stream_rows("contributor_ownership", filepath=path):
+        author_lines.setdefault(row["contributor"], []).append((row["start_line"], row["end_line"]))
+
+    return author_lines
+
+def get_changed_files(repo, old_commit, commit):
+    # both sides of a rename are listed as separate delete and add entries
+    lines = repo.repo.git.diff("--name-status", "--no-renames", old_commit, commit, "--", "*.py").split('\n')
+
+    return {l.split('\t')[-1] for l in lines if '\t' in l}
+
+@profiling.timed("update_repo")
+def update_repo(repo, db, old_commit, commit):
+    changed = get_changed_files(repo, old_commit, commit)
 
-def get_change_lines(line):
-    split_line = line.split(' ')[2].split(',')
+    change_repo_commit(repo, commit)
+
+    files = [f for f in get_repo_files(repo, commit) if f["repopath"] in changed]
+
+    print(len(changed), "files changed since", old_commit)
+
+    # line ownership at old_commit is moved through the diffs before the files are removed
+    carried = None
+    if CARRY_BLAME:
+        carried = carry_author_lines(str(repo.path), old_commit, commit, changed,
+                lambda path: stored_author_lines(db, path))
+        print(len(carried), "of", len(changed), "files carried forward, the rest are blamed")
+
+    # related functions are rebuilt as calls in unchanged files may point at changed functions
+    db.clear(["related_funcs"])
+    db.remove_files(changed)
+
+    parse_files(repo, db, commit, files, carried=carried)
+
+def get_snapshot(db):
+    rows = db.rows("snapshot")
+    if len(rows) == 0:
+        return None
+
+    return rows[0]["repo_path"], rows[0]["commit_sha"]
+
+def set_snapshot(db, repo_path, commit):
+    # ownership matrices describe the old snapshot
+    sparse_rank.invalidate(db)
+    db.clear(["snapshot"])
+    if commit is not None:
+        db.insert_rows("snapshot", ("repo_path", "commit_sha"), [(repo_path, commit)])
+    db.commit()
 
-    start_lineno = int(split_line[0][1:])
-    if (len(split_line) > 1):
-        end_lineno = start_lineno + int(split_line[1])
-    else:
-        end_lineno = start_lineno
+@profiling.timed("load_snapshot")
+def load_snapshot(repo, repo_path, db, commit):
+    # drop changes from the last PR
+    db.clear(CHANGE_TABLES)
 
-    return start_lineno, end_lineno
+    snapshot = get_snapshot(db)
 
-def get_changes(repo, conn, diff_commit, repo_path):
-    # go to PR commit
+    if snapshot == (repo_path, commit):
+        print("reusing snapshot at", commit)
+        return
+
+    # mark the snapshot as incomplete until it is updated
+    set_snapshot(db, repo_path, None)
 
-    lines = repo.git().diff(diff_commit).split('\n')
+    updated = False
+    if snapshot is not None and snapshot[0] == repo_path:
+        try:
+            update_repo(repo, db, snapshot[1], commit)
+            updated = True
+        except Exception as e:
+            print("could not update snapshot from", snapshot[1], e)
+            db.rollback()
 
-    files = {}
+    if not updated:
+        db.clear()
+        print("parsing main repo")
+        parse_repo(repo, db, commit)
 
-    path_name = ''
-    base_name = ''
-    old_path = ''
-    old_base = ''
+    set_snapshot(db, repo_path, commit)
 
-    # search through for lines starting with "diff --git"
-    for l in lines:
-        if l.startswith("diff --git"):
-            # extract first and second file names from there
-            path_name = l.split()[-1][2:]
-            base_name = os.path.basename(path_name)
-            old_path = l.split()[2][2:]
-            old_base = os.path.basename(path_name)
-            files[(path_name, base_name, old_path, old_base)] = []
-        elif l.startswith("@@"):
-            # search for @@ modified lines and add to list
-            # second set of ranges
-            start_lineno, end_lineno = get_change_lines(l)
-            files[(path_name, base_name, old_path, old_base)].append((start_lineno, end_lineno))
+def get_contributors(db):
+    return {contributor:{"affected":0, "related":0, "API":0} for contributor in db.contributors()}
 
+@profiling.timed("get_changes")
+def get_changes(repo, db, diff_commit, repo_path, PR_commit):
     # parse files
     print("parsing changed files")
-    for name, lines in files.items():
-        filepath = name[0]
-        filename = name[1]
-        old_filepath = name[2]
-        old_filename = name[3]
-        print("parsing file", old_filepath)
-
-        if old_filepath == '' or old_filename == '':
+    writer = FactWriter(db)
+    # files are handled one at a time as git writes the diff
+    for change in iter_diff(str(repo.path), diff_commit, PR_commit):
+        filepath = change["path"]
+        old_filepath = change["old_path"]
+
+        # added files have no old side and are matched on their new path
+        if old_filepath is None:
+            old_filepath = filepath
+        if old_filepath is None:
             continue
 
-        source_filepath = repo_path + '/' + filepath
-        # parse file
-        process_file(source_filepath, filepath, filename, conn, lines, old_filepath, old_filename)
+        old_filename = os.path.basename(old_filepath)
+        print("parsing file", old_filepath)
+
+        lines = changed_lines(change["hunks"])
+
+        # deleted files and pure renames have nothing to parse
+        if filepath is not None and len(lines) > 0:
+            filename = os.path.basename(filepath)
+            source_filepath = repo_path + '/' + filepath
+            # parse file
+            if SOURCE == "objects":
+                source = read_source(str(repo.path), filename, PR_commit + ":" + filepath)
+                if source is None:
+                    print("file", filepath, "does not exist in", PR_commit)
+                else:
+                    process_file(source_filepath, filepath, filename, writer, lines, old_filepath, old_filename, source)
+            else:
+                process_file(source_filepath, filepath, filename, writer, lines, old_filepath, old_filename)
 
         # add file
-        c = conn.cursor()
-        c.execute("INSERT INTO modified_files (filepath) VALUES (%s)",
-                (old_filepath, ))
-        conn.commit()
-        c.close()
-
-def modified_code_rank(conn):
-    # funcs
-    c = conn.cursor()
-    rows = c.execute("SELECT contributor, SUM(ownership) AS score "
-            + "FROM modified_funcs AS mf, "
-                + "(SELECT contributor, fs.filepath, fs.name, fo.ownership "
-                + "FROM func_ownership AS fo, functions AS fs WHERE fo.func_id = fs.id) AS f "
-            + "WHERE mf.name = f.name AND mf.filepath = f.filepath GROUP BY f.contributor ",
-            ())
-    keys = [k[0].decode('ascii') for k in c.description]
-    funcs = [dict(zip(keys, row)) for row in rows]
-    c.close()
-
-    # classes
-    c = conn.cursor()
-    rows = c.execute("SELECT contributor, SUM(ownership) AS score "
-            + "FROM modified_classes AS mc, "
-                + "(SELECT contributor, cs.filepath, cs.name, co.ownership "
-                + "FROM class_ownership AS co, classes as cs WHERE co.class_id = cs.id) AS c "
-            + "WHERE mc.name = c.name and mc.filepath = c.filepath GROUP BY c.contributor ",
-            ())
-    keys = [k[0].decode('ascii') for k in c.description]
-    classes = [dict(zip(keys, row)) for row in rows]
-    c.close()
-
-    # files
-    c = conn.cursor()
-    rows = c.execute("SELECT contributor, SUM(ownership) AS score "
-            + "FROM modified_files as mf, file_ownership as fo "
-            + "WHERE mf.filepath = fo.file_path GROUP BY fo.contributor ",
-            ())
-    keys = [k[0].decode('ascii') for k in c.description]
-    files = [dict(zip(keys, row)) for row in rows]
-    c.close()
+        writer.add("modified_files", (old_filepath, ))
+
+    writer.flush()
+
+def rank_engine(db):
+    # both engines answer the same score queries
+    if RANK_ENGINE == "sparse":
+        return sparse_rank.get_engine(db)
+
+    return db
 
+@profiling.timed("modified_rank")
+def modified_code_rank(db):
+    return normalise_modified_scores(*rank_engine(db).modified_scores())
+
+def normalise_modified_scores(funcs, classes, files):
     contributors = {}
 
     # add func scores
@@ -576,45 +651,11 @@ def modified_code_rank(conn):
 
     return contributors
 
-def related_code_rank(conn):
-    # fill modified_func_ids
-    c = conn.cursor()
-    c.execute("INSERT INTO modified_func_ids "
-            + "(SELECT DISTINCT f.id "
-                + "FROM modified_funcs AS mf, functions AS f "
-                + "WHERE mf.name = f.name AND mf.filepath = f.filepath) ",
-            ())
-    conn.commit()
-    c.close()
-
-    # get caller funcs
-    c = conn.cursor()
-    rows = c.execute("SELECT contributor, SUM(ownership) AS score "
-            + "FROM func_ownership AS fo, "
-                + "(SELECT DISTINCT caller_id AS id "
-                + "FROM related_funcs AS rf, modified_func_ids as mi "
-                + "WHERE rf.called_id = mi.id AND rf.caller_id NOT IN "
-                    + "(SELECT id from modified_func_ids)) AS fm "
-                + "WHERE fo.func_id = fm.id GROUP BY contributor",
-            ())
-    keys = [k[0].decode('ascii') for k in c.description]
-    caller_funcs = [dict(zip(keys, row)) for row in rows]
-    c.close()
-
-    # get called funcs
-    c = conn.cursor()
-    rows = c.execute("SELECT contributor, SUM(ownership) AS score "
-            + "FROM func_ownership AS fo, "
-                + "(SELECT DISTINCT called_id AS id "
-                + "FROM related_funcs AS rf, modified_func_ids as mi "
-                + "WHERE rf.caller_id = mi.id AND rf.called_id NOT IN "
-                    + "(SELECT id from modified_func_ids)) AS fm "
-                + "WHERE fo.func_id = fm.id GROUP BY contributor",
-            ())
-    keys = [k[0].decode('ascii') for k in c.description]
-    called_funcs = [dict(zip(keys, row)) for row in rows]
-    c.close()
+@profiling.timed("related_rank")
+def related_code_rank(db):
+    return normalise_related_scores(*rank_engine(db).related_scores())
 
+def normalise_related_scores(caller_funcs, called_funcs):
     # combine
     total = sum(float(f["score"]) for f in caller_funcs) + sum(float(f["score"]) for f in called_funcs)
     contributors = {}
@@ -630,19 +671,12 @@ def related_code_rank(conn):
 
     return contributors
 
-def api_usage_rank(conn):
+@profiling.timed("api_rank")
+def api_usage_rank(db):
     # get api usage scores
-    c = conn.cursor()
-    rows = c.execute("SELECT contributor, SUM(score) AS score "
-            + "FROM (SELECT mc.base_name, mc.name, ao.contributor, (mc.counts * ao.counts) AS score "
-                + "FROM modified_func_calls AS mc, api_ownership AS ao "
-                + "WHERE mc.base_name = ao.base AND mc.name = ao.name) AS scores "
-            + "GROUP BY contributor",
-            ())
-    keys = [k[0].decode('ascii') for k in c.description]
-    api_contributor_scores = [dict(zip(keys, row)) for row in rows]
-    c.close()
+    return normalise_api_scores(rank_engine(db).api_scores())
 
+def normalise_api_scores(api_contributor_scores):
     contributors = {}
     total = sum(float(a["score"]) for a in api_contributor_scores)
 
@@ -688,196 +722,277 @@ def combine_ranks(ranks):
 
     return sorted_ranks
 
-def rank_contributors(repo, repo_path, conn, main_commit, PR_commit):
-    contributors = get_contributors(conn)
+@profiling.timed("score_contributors")
+def score_contributors(repo, repo_path, db, main_commit, PR_commit):
+    contributors = get_contributors(db)
 
     change_repo_commit(repo, PR_commit)
 
     # get changes functions and classes
     print("getting changes from PR")
-    get_changes(repo, conn, main_commit, repo_path)
+    get_changes(repo, db, main_commit, repo_path, PR_commit)
 
     print("calculating ranks")
     # rank
     # modified code rank
-    modified_scores = modified_code_rank(conn)
+    modified_scores = modified_code_rank(db)
     # related code rank
-    related_scores = related_code_rank(conn)
+    related_scores = related_code_rank(db)
     # api usage rank
-    api_scores = api_usage_rank(conn)
-
-    # rank
-    ranks = []
+    api_scores = api_usage_rank(db)
 
-    if MODIFIED_STR in metrics_in_use:
-        modified_ranks = get_ranks(modified_scores)
-        ranks.append(modified_ranks)
+    return {MODIFIED_STR: modified_scores, RELATED_STR: related_scores, API_STR: api_scores}
 
-    if RELATED_STR in metrics_in_use:
-        related_ranks = get_ranks(related_scores)
-        ranks.append(related_ranks)
-
-    if API_STR in metrics_in_use:
-        api_ranks = get_ranks(api_scores)
-        ranks.append(api_ranks)
+def rank_scores(scores, metrics):
+    # ranks are combined in a fixed metric order so ties sort the same way for every variant
+    ranks = [get_ranks(scores[metric]) for metric in [MODIFIED_STR, RELATED_STR, API_STR] if metric in metrics]
 
     return combine_ranks(ranks)
 
-def clear_db(conn):
-    tables = ["related_funcs", "api_ownership", "file_ownership", "class_ownership", "func_ownership",
-            "contributor_ownership", "functions", "classes", "func_call" , "modified_funcs", "modified_classes",
-            "modified_files", "modified_func_calls", "modified_func_ids"]
+def rank_contributors(repo, repo_path, db, main_commit, PR_commit, metrics=None):
+    if metrics is None:
+        metrics = metrics_in_use
 
-    for table in tables:
-        c = conn.cursor()
-        c.execute("DELETE FROM " + table, ())
-        conn.commit()
-        c.close()
+    return rank_scores(score_contributors(repo, repo_path, db, main_commit, PR_commit), metrics)
 
 def get_repo(repo_path):
     return pydriller.GitRepository(repo_path)
 
-def rank_PR(repo_path, main_commit, PR_commit):
-    # connect to db
-    conn = pg8000.connect(user="postgres", password="pass", database="review_recomender", host="review-psql")
-
-    # clear db
-    clear_db(conn)
-
+def score_PR(repo_path, main_commit, PR_commit, db, reset=True):
     repo = get_repo(repo_path)
 
-    print("parsing main repo")
-    parse_repo(repo, conn, main_commit)
-
-    ranks = rank_contributors(repo, repo_path, conn, main_commit, PR_commit)
+    # bring the stored snapshot to the PR's base commit
+    load_snapshot(repo, repo_path, db, main_commit)
 
-    conn.close()
+    scores = score_contributors(repo, repo_path, db, main_commit, PR_commit)
 
-    repo.reset()
+    if reset and SOURCE != "objects":
+        repo.reset()
 
-    return ranks
+    return scores
 
-def get_github_pr_reviewers(pr):
-    reviews = pr.get_reviews()
-    reviewers = []
+def score_PR_batch(repo_path, main_commit, PR_commits, db):
+    # PRs sharing a base commit, scored with one sparse product per metric
+    repo = get_repo(repo_path)
+    load_snapshot(repo, repo_path, db, main_commit)
+    engine = sparse_rank.get_engine(db)
 
-    for i in range(reviews.totalCount):
-        reviewers.append(reviews[i].user.email)
+    vectors = []
+    for PR_commit in PR_commits:
+        db.clear(CHANGE_TABLES)
+        change_repo_commit(repo, PR_commit)
+        get_changes(repo, db, main_commit, repo_path, PR_commit)
+        vectors.append(engine.pr_vectors())
+    db.clear(CHANGE_TABLES)
 
-    return reviewers
+    if SOURCE != "objects":
+        repo.reset()
 
-def get_github_pr_last_commit(pr):
-    commits = pr.get_commits()
+    return [{MODIFIED_STR: normalise_modified_scores(*modified),
+            RELATED_STR: normalise_related_scores(*related),
+            API_STR: normalise_api_scores(api)}
+            for modified, related, api in engine.score_batch(vectors)]
 
-    return commits[commits.totalCount - 1].sha
+def rank_PR(repo_path, main_commit, PR_commit, db):
+    return rank_scores(score_PR(repo_path, main_commit, PR_commit, db), metrics_in_use)
 
 def clone_repo(url, name):
     repo_path = REPOS_DIR + name
     # if repo not already cloned
     if not os.path.isdir(repo_path):
+        if OFFLINE:
+            return None
+
         print("cloning repo", url)
         Repo.clone_from(url, repo_path)
 
     return repo_path
 
-def get_github_commits(repo, pr):
-    pr_commits = pr.get_commits()
-    all_commits = repo.get_commits()
-
-    pr_commit = pr_commits[pr_commits.totalCount - 1]
-
-    i = 0
-    # find first pr commit
-    while i < all_commits.totalCount:
-        if all_commits[i] == pr_commit:
-            break
-        i += 1
-
-    # find first non pr commit
-    while i < all_commits.totalCount:
-        if all_commits[i] not in pr_commits:
-            break
-        i += 1
-
-    if i >= all_commits.totalCount:
-        return None
-
-    main_commit = all_commits[i]
-
-    return main_commit.sha, pr_commit.sha
-
-def handle_github_pr(g_repo, pr_id):
-    pr = g_repo.get_pull(pr_id)
+def prepare_github_pr(metadata, pr_id):
+    # (repo path, base commit, head commit, reviewers), None if the PR can not be evaluated
+    repo_data = metadata.repo()
+    pr_data = metadata.pr(pr_id)
+    if repo_data is None or pr_data is None:
+        print("no metadata for PR", pr_id)
+        return
 
     # only do if already merged as not sure how can do it otherwise
-    if not pr.merged:
+    if not pr_data["merged"]:
         # error cant compare against as dont have merge commit
         print("PR not merged", pr_id)
         return
 
-    user = pr.user.email
-    reviewers = get_github_pr_reviewers(pr)
-
-    commits = get_github_commits(g_repo, pr)
-    if commits == None:
-        print("Issue finding commits", pr_id)
-        return
-
-    main_commit, pr_commit = commits
-
+    reviewers = pr_data["reviewers"]
     if reviewers == []:
         # no ground truth to compare against
         print("no original reviewers found", pr_id)
         return
 
-    # clone repo if not already cloned and return pydriller repo object
-    repo_path = clone_repo(g_repo.clone_url, g_repo.name)
+    # clone repo if not already cloned
+    repo_path = clone_repo(repo_data["clone_url"], repo_data["name"])
+    if repo_path is None:
+        print("repo not cloned", repo_data["name"])
+        return
 
-    print("ranking PR", pr_commit)
-    ranks = rank_PR(repo_path, main_commit, pr_commit)
+    main_commit = get_base_commit(repo_path, pr_data, OFFLINE)
+    if main_commit == None:
+        print("Issue finding commits", pr_id)
+        return
 
-    return ranks, reviewers
+    return repo_path, main_commit, pr_data["head"], reviewers
 
-def write_results(repo_name, pr_id, recomend_ranks, correct_reviewers, test_name):
-    result_filename = RESULT_DIR + test_name + "_" + os.path.basename(repo_name) + str(pr_id)
+def handle_github_pr(metadata, pr_id, db):
+    pr = prepare_github_pr(metadata, pr_id)
+    if pr is None:
+        return
+
+    repo_path, main_commit, pr_commit, reviewers = pr
 
-    # if results dir does not exist create it
-    if not os.path.isdir(RESULT_DIR):
-        os.mkdir(RESULT_DIR)
+    print("ranking PR", pr_commit)
+    scores = score_PR(repo_path, main_commit, pr_commit, db)
 
-    f = open(result_filename, "w")
+    return scores, reviewers
 
-    json.dump({"recomended":recomend_ranks, "correct":correct_reviewers}, f)
-    print(json.dumps({"recomended":recomend_ranks, "correct":correct_reviewers}))
+def write_profile(profile):
+    profiling.write(profile, PROFILE_DIR + profile.name + ".json")
 
-    f.close
+def write_results(sink, repo_name, pr_id, recomend_ranks, correct_reviewers, test_name):
+    sink.write(test_name, repo_name, pr_id, recomend_ranks, correct_reviewers)
 
-def test_github_repo(repo_full_name, pr_list, test_name):
-    github_access = get_github_access()
+def test_github_repo(repo_full_name, pr_list, variants, sink):
+    github_access = None if OFFLINE else get_github_access()
 
-    g_repo = github_access.get_repo(repo_full_name)
+    metadata = PRMetadata(repo_full_name, github_access)
+    prefetch_metadata(metadata, pr_list)
 
     print("testing repo", repo_full_name)
 
+    # kept open across PRs so each PR only updates the stored snapshot
+    db = connect_storage(STORAGE)
+
     for pr_data in pr_list:
-        github_access = get_github_access()
         pr_id = pr_data[0]
         print("testing pr", pr_id)
-        ranks = handle_github_pr(g_repo, pr_id)
-        if ranks == None:
+        profiling.start(os.path.basename(repo_full_name) + str(pr_id))
+        scores = handle_github_pr(metadata, pr_id, db)
+        write_profile(profiling.stop())
+        if scores == None:
             print("pr", pr_id, "failed")
             continue
         correct_reviewers = pr_data[1:]
-        recomend_ranks, _ = ranks
-        # write to file to analyze
-        write_results(repo_full_name, pr_id, recomend_ranks, correct_reviewers, test_name)
+        pr_scores, _ = scores
+        # write every variant's ranks to file to analyze
+        for test_name, metrics in variants.items():
+            write_results(sink, repo_full_name, pr_id, rank_scores(pr_scores, metrics), correct_reviewers, test_name)
+
+    db.close()
+    sink.flush()
+
+# slot of this evaluation worker and its storage and worktree per repo
+worker_slot = None
+worker_storage = None
+worker_worktrees = {}
+
+def init_worker(slots):
+    global worker_slot, worker_storage, PARSE_WORKERS, BLAME_WORKERS
+    worker_slot = slots.get()
+    worker_storage = connect_storage(STORAGE, "worker_" + str(worker_slot))
+
+    # the cores are already shared between evaluation workers
+    PARSE_WORKERS = 1
+    BLAME_WORKERS = max((os.cpu_count() or 1) // JOBS, 1)
+
+def get_worktree(repo_path):
+    # detached worktree sharing the clone's objects, kept between runs like the clone
+    if repo_path not in worker_worktrees:
+        worktree_path = WORKTREES_DIR + os.path.basename(repo_path) + "_" + str(worker_slot)
+        if not os.path.isdir(worktree_path):
+            subprocess.run(["git", "-C", repo_path, "worktree", "prune"], check=True)
+            subprocess.run(["git", "-C", repo_path, "worktree", "add", "-q", "--detach",
+                    os.path.abspath(worktree_path)], check=True)
+        worker_worktrees[repo_path] = worktree_path
+
+    return worker_worktrees[repo_path]
+
+def score_prs(repo_path, prs):
+    # runs in an evaluation worker, returns (pr id, scores, reviewers) with None scores for failed PRs
+    worktree_path = get_worktree(repo_path)
+
+    results = []
+    for pr_id, main_commit, pr_commit, reviewers in prs:
+        print("ranking PR", pr_commit, "in worker", worker_slot)
+        profiling.start(os.path.basename(repo_path) + str(pr_id))
+        try:
+            # the main branch is checked out in the clone so a worktree stays detached
+            scores = score_PR(worktree_path, main_commit, pr_commit, worker_storage, False)
+        except Exception as e:
+            print("pr", pr_id, "failed", e)
+            scores = None
+        write_profile(profiling.stop())
+        results.append((pr_id, scores, reviewers))
 
-def get_github_access():
+    return results
+
+def test_github_repo_parallel(repo_full_name, pr_list, variants, jobs, sink):
+    github_access = None if OFFLINE else get_github_access()
+
+    metadata = PRMetadata(repo_full_name, github_access)
+    prefetch_metadata(metadata, pr_list)
+
+    print("testing repo", repo_full_name, "with", jobs, "jobs")
+
+    # metadata and base commits are resolved here so workers never talk to github or fetch
+    prs = []
+    correct = {}
+    for pr_data in pr_list:
+        pr_id = pr_data[0]
+        pr = prepare_github_pr(metadata, pr_id)
+        if pr is None:
+            print("pr", pr_id, "failed")
+            continue
+        repo_path, main_commit, pr_commit, reviewers = pr
+        correct[pr_id] = pr_data[1:]
+        prs.append((pr_id, main_commit, pr_commit, reviewers))
+
+    if len(prs) == 0:
+        return
+
+    chunks = [prs[i:i + JOB_CHUNK_SIZE] for i in range(0, len(prs), JOB_CHUNK_SIZE)]
+
+    slots = multiprocessing.Queue()
+    for slot in range(jobs):
+        slots.put(slot)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(slots, )) as executor:
+        futures = [executor.submit(score_prs, repo_path, chunk) for chunk in chunks]
+
+        # results are written as each chunk finishes
+        for future in as_completed(futures):
+            for pr_id, scores, _ in future.result():
+                if scores is None:
+                    print("pr", pr_id, "failed")
+                    continue
+                for test_name, metrics in variants.items():
+                    write_results(sink, repo_full_name, pr_id, rank_scores(scores, metrics), correct[pr_id], test_name)
+
+    sink.flush()
+
+def read_access_token():
     f = open("access_token")
     token = f.read().rstrip()
     f.close()
 
-    return Github(token, timeout=60)
+    return token
+
+def get_github_access():
+    return Github(read_access_token(), timeout=60)
+
+def prefetch_metadata(metadata, pr_list):
+    # every PR's metadata is fetched at once before any PR is evaluated
+    if OFFLINE:
+        return
+
+    metadata.prefetch([pr_data[0] for pr_data in pr_list], read_access_token())
 
 def load_repo_json():
     f = open(REPOS_DIR + "test_repos.json")
@@ -886,23 +1001,32 @@ def load_repo_json():
 
     return repos
 
-def test_github_repos(test_name):
+def test_github_repos(variants=VARIANTS, jobs=1):
     repos = load_repo_json()
 
+    # every result of the run is appended to one file
+    sink = ResultsSink(RESULTS_FILE)
+    print("writing run", sink.run, "to", RESULTS_FILE)
+
     for repo in repos:
-        test_github_repo(repo["name"], repo["prs"], test_name)
+        if jobs > 1:
+            test_github_repo_parallel(repo["name"], repo["prs"], variants, jobs, sink)
+        else:
+            test_github_repo(repo["name"], repo["prs"], variants, sink)
+
+    sink.close()
 
 def main():
-    test_github_repos("all")
+    global JOBS
 
-    metrics_in_use = [MODIFIED_STR]
-    test_github_repos(MODIFIED_STR)
+    parser = argparse.ArgumentParser(description="evaluate reviewer recommendations on the test repositories")
+    parser.add_argument("--jobs", type=int, default=JOBS, help="PRs evaluated at once, 0 uses every core")
+    args = parser.parse_args()
 
-    metrics_in_use = [RELATED_STR]
-    test_github_repos(RELATED_STR)
+    JOBS = args.jobs if args.jobs > 0 else os.cpu_count() or 1
 
-    metrics_in_use = [API_STR]
-    test_github_repos(API_STR)
+    # each PR is parsed and scored once and ranked for every variant
+    test_github_repos(VARIANTS, JOBS)
 
     #main_commit = "b0dae2fedc65878ef8a124aa0f878a1de7a2fcb3" # "HEAD"
     #PR_commit = "23f437f1656fff0fe89aa18ce94be2080fcab35d" # "HEAD"
@@ -913,4 +1037,5 @@ def main():
 
     #print(ranks)
 
-main()
+if __name__ == "__main__":
+    main()
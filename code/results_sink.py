@@ -0,0 +1,67 @@
+import json
+import os
+import time
+import uuid
+
+# records buffered between flushes to disk
+FLUSH_EVERY = 100
+BUFFER_BYTES = 1 << 16
+
+def new_run_id():
+    # runs started in the same second append to the same file, the suffix keeps their records apart
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+def ends_with_newline(path):
+    f = open(path, "rb")
+    f.seek(-1, os.SEEK_END)
+    last = f.read(1)
+    f.close()
+
+    return last == b"\n"
+
+class ResultsSink:
+    def __init__(self, path, run=None):
+        # every run appends to the same file, records carry the run they came from
+        directory = os.path.dirname(path)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.run = run if run is not None else new_run_id()
+        self.f = open(path, "a", buffering=BUFFER_BYTES)
+        self.pending = 0
+
+        # a killed run can leave half a line, start on a fresh one so only that record is lost
+        if self.f.tell() > 0 and not ends_with_newline(path):
+            self.f.write("\n")
+
+    def write(self, variant, repo_name, pr_id, recomended, correct):
+        self.f.write(json.dumps({"run": self.run, "variant": variant, "repo": repo_name, "pr": pr_id,
+                "recomended": recomended, "correct": correct}) + "\n")
+
+        self.pending += 1
+        if self.pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        # everything written so far survives the run being killed
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+def read_results(path):
+    if not os.path.isfile(path):
+        return
+
+    f = open(path)
+    for line in f:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # the last line of a killed run may be cut short
+            continue
+    f.close()
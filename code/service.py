@@ -0,0 +1,216 @@
+#!/bin/python3.8
+# local HTTP/JSON service that keeps each repository's snapshot warm between requests
+import argparse
+import json
+import subprocess
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import py_parse
+from storage import MemoryStorage
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+
+class RepoIndex:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.db = MemoryStorage()
+        self.repo = py_parse.get_repo(repo_path)
+        # one request at a time per repository, different repositories run in parallel
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def describe(self):
+        snapshot = py_parse.get_snapshot(self.db)
+
+        return {"repo": self.repo_path,
+                "commit": snapshot[1] if snapshot is not None else None,
+                "functions": len(self.db.tables["functions"]),
+                "last_used": self.last_used}
+
+indexes = {}
+indexes_lock = threading.Lock()
+
+def get_index(repo_path):
+    with indexes_lock:
+        if repo_path not in indexes:
+            indexes[repo_path] = RepoIndex(repo_path)
+
+        return indexes[repo_path]
+
+class BadCommit(Exception):
+    pass
+
+def resolve_commit(repo_path, ref):
+    # full sha of a commit, snapshots and blame caches are keyed by it so a moved branch is never stale
+    if not isinstance(ref, str) or ref == "" or ref.startswith("-"):
+        raise BadCommit("invalid commit " + json.dumps(ref))
+
+    result = subprocess.run(["git", "-C", repo_path, "rev-parse", "--verify", "-q", ref + "^{commit}"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if result.returncode != 0:
+        raise BadCommit("unknown commit " + ref + " in " + repo_path)
+
+    return result.stdout.strip()
+
+def rank(repo_path, base, head):
+    # checked before the index is touched, a bad base would otherwise clear the warm snapshot
+    base = resolve_commit(repo_path, base)
+    head = resolve_commit(repo_path, head)
+
+    index = get_index(repo_path)
+    timings = {}
+
+    with index.lock:
+        index.last_used = time.time()
+
+        start = time.time()
+        py_parse.load_snapshot(index.repo, repo_path, index.db, base)
+        timings["snapshot"] = time.time() - start
+
+        start = time.time()
+        ranks = py_parse.rank_contributors(index.repo, repo_path, index.db, base, head)
+        timings["rank"] = time.time() - start
+
+    return ranks, timings
+
+def rank_batch(repo_path, base, heads):
+    # heads sharing a base are scored together with the sparse engine
+    base = resolve_commit(repo_path, base)
+    if not isinstance(heads, list):
+        raise BadCommit("heads is not a list")
+    commits = [resolve_commit(repo_path, head) for head in heads]
+
+    index = get_index(repo_path)
+    timings = {}
+
+    with index.lock:
+        index.last_used = time.time()
+
+        start = time.time()
+        scores = py_parse.score_PR_batch(repo_path, base, commits, index.db)
+        timings["rank"] = time.time() - start
+
+    ranks = {head: py_parse.rank_scores(head_scores, py_parse.metrics_in_use)
+            for head, head_scores in zip(heads, scores)}
+
+    return ranks, timings
+
+def evict(repo_path):
+    # None evicts every repository
+    with indexes_lock:
+        if repo_path is None:
+            evicted = list(indexes)
+            indexes.clear()
+        elif repo_path in indexes:
+            evicted = [repo_path]
+            del indexes[repo_path]
+        else:
+            evicted = []
+
+    return evicted
+
+def refresh(repo_path):
+    # rebuilds the snapshot from scratch, for example after history was rewritten
+    index = get_index(repo_path)
+
+    with index.lock:
+        snapshot = py_parse.get_snapshot(index.db)
+        index.db.clear()
+
+        if snapshot is not None:
+            py_parse.load_snapshot(index.repo, repo_path, index.db, snapshot[1])
+
+        return index.describe()
+
+class Handler(BaseHTTPRequestHandler):
+    def send_json(self, status, body, timings=None):
+        data = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if timings is not None:
+            self.send_header("Server-Timing", ", ".join(name + ";dur=" + str(round(seconds * 1000, 1))
+                    for name, seconds in timings.items()))
+        self.send_header("X-Response-Time", str(round((time.time() - self.start) * 1000, 1)) + "ms")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return {}
+
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        self.start = time.time()
+
+        if self.path == "/admin/indexes":
+            with indexes_lock:
+                current = list(indexes.values())
+            self.send_json(200, {"indexes": [index.describe() for index in current]})
+        else:
+            self.send_json(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        self.start = time.time()
+
+        try:
+            body = self.read_json()
+        except ValueError:
+            self.send_json(400, {"error": "body is not valid json"})
+            return
+
+        try:
+            if self.path == "/rank":
+                missing = [key for key in ["repo", "base", "head"] if key not in body]
+                if len(missing) > 0:
+                    self.send_json(400, {"error": "missing " + ", ".join(missing)})
+                    return
+
+                ranks, timings = rank(body["repo"], body["base"], body["head"])
+                self.send_json(200, {"ranks": ranks}, timings)
+            elif self.path == "/rank_batch":
+                missing = [key for key in ["repo", "base", "heads"] if key not in body]
+                if len(missing) > 0:
+                    self.send_json(400, {"error": "missing " + ", ".join(missing)})
+                    return
+
+                ranks, timings = rank_batch(body["repo"], body["base"], body["heads"])
+                self.send_json(200, {"ranks": ranks}, timings)
+            elif self.path == "/admin/evict":
+                self.send_json(200, {"evicted": evict(body.get("repo"))})
+            elif self.path == "/admin/refresh":
+                if "repo" not in body:
+                    self.send_json(400, {"error": "missing repo"})
+                    return
+
+                self.send_json(200, refresh(body["repo"]))
+            else:
+                self.send_json(404, {"error": "unknown path " + self.path})
+        except BadCommit as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+def main():
+    parser = argparse.ArgumentParser(description="serve reviewer recommendations over HTTP")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--parse-workers", type=int, default=1)
+    args = parser.parse_args()
+
+    # requests for different repositories must not check out over each other
+    py_parse.SOURCE = "objects"
+    py_parse.PARSE_WORKERS = args.parse_workers
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print("serving on", args.host + ":" + str(args.port))
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import weakref
+
+from storage import score_rows
+
+# contributor x entity ownership matrices are stored by column, entity -> {contributor: value},
+# and a PR is a sparse vector over the same entities, entity -> weight
+
+def add_column(columns, entity, contributor, value):
+    column = columns.setdefault(entity, {})
+    column[contributor] = column.get(contributor, 0) + value
+
+def multiply(columns, vectors):
+    # ownership matrix times a matrix of PR vectors, one score dict per vector
+    results = [{} for _ in vectors]
+
+    # group the nonzeros by entity so each column is read once for the whole batch
+    by_entity = {}
+    for i, vector in enumerate(vectors):
+        for entity, weight in vector.items():
+            by_entity.setdefault(entity, []).append((i, weight))
+
+    for entity, weights in by_entity.items():
+        column = columns.get(entity)
+        if column is None:
+            continue
+
+        for i, weight in weights:
+            scores = results[i]
+            for contributor, value in column.items():
+                scores[contributor] = scores.get(contributor, 0.0) + value * weight
+
+    return results
+
+class OwnershipMatrices:
+    def __init__(self, db):
+        self.func_ids = {}
+        self.class_ids = {}
+        for f in db.stream_rows("functions"):
+            self.func_ids.setdefault((f["filepath"], f["name"]), []).append(f["id"])
+        for c in db.stream_rows("classes"):
+            self.class_ids.setdefault((c["filepath"], c["name"]), []).append(c["id"])
+
+        self.funcs = {}
+        for fo in db.stream_rows("func_ownership"):
+            add_column(self.funcs, fo["func_id"], fo["contributor"], fo["ownership"])
+
+        self.classes = {}
+        for co in db.stream_rows("class_ownership"):
+            add_column(self.classes, co["class_id"], co["contributor"], co["ownership"])
+
+        self.files = {}
+        for fo in db.stream_rows("file_ownership"):
+            add_column(self.files, fo["file_path"], fo["contributor"], fo["ownership"])
+
+        # calls are counted per file in the snapshot but scored per (base, name)
+        self.apis = {}
+        for ao in db.stream_rows("api_ownership"):
+            add_column(self.apis, (ao["base"], ao["name"]), ao["contributor"], ao["counts"])
+
+        self.callers = {}
+        self.called = {}
+        for rf in db.stream_rows("related_funcs"):
+            self.callers.setdefault(rf["called_id"], set()).add(rf["caller_id"])
+            self.called.setdefault(rf["caller_id"], set()).add(rf["called_id"])
+
+class PRVectors:
+    # the PR's changes as sparse vectors over the matrices' entities
+    def __init__(self, db, matrices):
+        self.funcs = {}
+        for mf in db.rows("modified_funcs"):
+            for func_id in matrices.func_ids.get((mf["filepath"], mf["name"]), []):
+                self.funcs[func_id] = self.funcs.get(func_id, 0) + 1
+
+        self.classes = {}
+        for mc in db.rows("modified_classes"):
+            for class_id in matrices.class_ids.get((mc["filepath"], mc["name"]), []):
+                self.classes[class_id] = self.classes.get(class_id, 0) + 1
+
+        self.files = {}
+        for mf in db.rows("modified_files"):
+            self.files[mf["filepath"]] = self.files.get(mf["filepath"], 0) + 1
+
+        # functions calling or called by a modified function, each counted once
+        modified_ids = set(self.funcs)
+        self.callers = {}
+        self.called = {}
+        for func_id in modified_ids:
+            for caller_id in matrices.callers.get(func_id, ()):
+                if caller_id not in modified_ids:
+                    self.callers[caller_id] = 1
+            for called_id in matrices.called.get(func_id, ()):
+                if called_id not in modified_ids:
+                    self.called[called_id] = 1
+
+        self.apis = {(mc["base_name"], mc["name"]): mc["counts"] for mc in db.rows("modified_func_calls")}
+
+class SparseEngine:
+    # same score queries as the storage backends, answered from ownership matrices
+    def __init__(self, db, matrices):
+        self.db = db
+        self.matrices = matrices
+
+    def pr_vectors(self):
+        return PRVectors(self.db, self.matrices)
+
+    def modified_batch(self, vectors):
+        m = self.matrices
+        funcs = multiply(m.funcs, [v.funcs for v in vectors])
+        classes = multiply(m.classes, [v.classes for v in vectors])
+        files = multiply(m.files, [v.files for v in vectors])
+
+        return [(score_rows(funcs[i]), score_rows(classes[i]), score_rows(files[i])) for i in range(len(vectors))]
+
+    def related_batch(self, vectors):
+        callers = multiply(self.matrices.funcs, [v.callers for v in vectors])
+        called = multiply(self.matrices.funcs, [v.called for v in vectors])
+
+        return [(score_rows(callers[i]), score_rows(called[i])) for i in range(len(vectors))]
+
+    def api_batch(self, vectors):
+        return [score_rows(scores) for scores in multiply(self.matrices.apis, [v.apis for v in vectors])]
+
+    def score_batch(self, vectors):
+        # (modified, related, api) score rows for each PR vector
+        return list(zip(self.modified_batch(vectors), self.related_batch(vectors), self.api_batch(vectors)))
+
+    def modified_scores(self):
+        return self.modified_batch([self.pr_vectors()])[0]
+
+    def related_scores(self):
+        return self.related_batch([self.pr_vectors()])[0]
+
+    def api_scores(self):
+        return self.api_batch([self.pr_vectors()])[0]
+
+# matrices per storage, dropped when its snapshot changes
+matrices_cache = weakref.WeakKeyDictionary()
+
+def get_engine(db):
+    if db not in matrices_cache:
+        matrices_cache[db] = OwnershipMatrices(db)
+
+    return SparseEngine(db, matrices_cache[db])
+
+def invalidate(db):
+    matrices_cache.pop(db, None)
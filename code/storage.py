@@ -0,0 +1,660 @@
+import pg8000
+import itertools
+from collections import namedtuple
+import profiling
+from intervals import IntervalIndex
+
+TABLES = ["snapshot", "related_funcs", "api_ownership", "file_ownership", "class_ownership", "func_ownership",
+        "contributor_ownership", "functions", "classes", "func_call" , "modified_funcs", "modified_classes",
+        "modified_files", "modified_func_calls", "modified_func_ids"]
+
+# tables filled from a PR's changes, everything else describes the snapshot
+CHANGE_TABLES = ["modified_funcs", "modified_classes", "modified_files", "modified_func_calls", "modified_func_ids"]
+
+# snapshot tables with a filepath column
+FILE_TABLES = ["functions", "classes", "func_call", "contributor_ownership", "api_ownership"]
+
+# materialised views in init.psql summing ownership per entity, refreshed once ownership is assigned
+ROLLUPS = ["func_owner_rollup", "class_owner_rollup", "api_owner_rollup"]
+
+# the queries behind a PR's scores, check_query_plans.py makes sure they stay on indexes
+RANK_QUERIES = {
+    "modified_funcs": "SELECT contributor, SUM(ownership) AS score "
+        + "FROM modified_funcs AS mf, func_owner_rollup AS f "
+        + "WHERE mf.name = f.name AND mf.filepath = f.filepath GROUP BY f.contributor ",
+    "modified_classes": "SELECT contributor, SUM(ownership) AS score "
+        + "FROM modified_classes AS mc, class_owner_rollup AS c "
+        + "WHERE mc.name = c.name and mc.filepath = c.filepath GROUP BY c.contributor ",
+    "modified_files": "SELECT contributor, SUM(ownership) AS score "
+        + "FROM modified_files as mf, file_ownership as fo "
+        + "WHERE mf.filepath = fo.file_path GROUP BY fo.contributor ",
+    "modified_func_ids": "INSERT INTO modified_func_ids "
+        + "(SELECT DISTINCT f.id "
+            + "FROM modified_funcs AS mf, functions AS f "
+            + "WHERE mf.name = f.name AND mf.filepath = f.filepath) ",
+    "caller_funcs": "SELECT contributor, SUM(ownership) AS score "
+        + "FROM func_ownership AS fo, "
+            + "(SELECT DISTINCT caller_id AS id "
+            + "FROM related_funcs AS rf, modified_func_ids as mi "
+            + "WHERE rf.called_id = mi.id AND rf.caller_id NOT IN "
+                + "(SELECT id from modified_func_ids)) AS fm "
+            + "WHERE fo.func_id = fm.id GROUP BY contributor",
+    "called_funcs": "SELECT contributor, SUM(ownership) AS score "
+        + "FROM func_ownership AS fo, "
+            + "(SELECT DISTINCT called_id AS id "
+            + "FROM related_funcs AS rf, modified_func_ids as mi "
+            + "WHERE rf.caller_id = mi.id AND rf.called_id NOT IN "
+                + "(SELECT id from modified_func_ids)) AS fm "
+            + "WHERE fo.func_id = fm.id GROUP BY contributor",
+    "api": "SELECT contributor, SUM(mc.counts * ao.counts) AS score "
+        + "FROM modified_func_calls AS mc, api_owner_rollup AS ao "
+        + "WHERE mc.base_name = ao.base AND mc.name = ao.name "
+        + "GROUP BY contributor",
+}
+
+# ownership tables filled from contributor_ownership, with the entity table and id column they refer to
+ENTITY_OWNERSHIP = [("func_ownership", "functions", "func_id"), ("class_ownership", "classes", "class_id")]
+
+def entity_ownership_query(table, entities, id_column, per_file):
+    # share of each entity's lines each contributor owns, from the overlap of their line ranges
+    return ("INSERT INTO " + table + " (contributor, " + id_column + ", ownership) "
+        + "SELECT co.contributor, e.id, "
+            + "SUM(upper(co.lines * e.lines) - lower(co.lines * e.lines))::FLOAT / (e.end_line - e.start_line + 1) "
+        + "FROM " + entities + " AS e, contributor_ownership AS co "
+        + "WHERE co.filepath = e.filepath AND co.lines && e.lines "
+        + ("AND e.filepath = ANY(%s) " if per_file else "")
+        + "GROUP BY e.id, co.contributor")
+
+# rows per INSERT statement, keeps the parameter count under the protocol limit
+BATCH_ROWS = 1000
+# rows per FETCH when a query is streamed through a server side cursor
+STREAM_CHUNK_ROWS = 10000
+
+def connect_storage(backend, namespace=None):
+    # namespace keeps a worker's tables apart from every other connection's
+    if backend == "memory":
+        return MemoryStorage()
+
+    conn = pg8000.connect(user="postgres", password="pass", database="review_recomender", host="review-psql")
+    if namespace is not None:
+        use_schema(conn, namespace)
+
+    return PostgresStorage(conn)
+
+def use_schema(conn, schema):
+    # copies of the public tables and rollups, every query finds them through the search path
+    c = conn.cursor()
+    c.execute("CREATE SCHEMA IF NOT EXISTS " + schema, ())
+    for table in TABLES:
+        c.execute("CREATE TABLE IF NOT EXISTS " + schema + "." + table
+                + " (LIKE public." + table + " INCLUDING ALL)", ())
+
+    for view in ROLLUPS:
+        if len(list(c.execute("SELECT 1 FROM pg_matviews WHERE schemaname = (%s) AND matviewname = (%s)",
+                (schema, view)))) > 0:
+            continue
+
+        # definitions name their tables unqualified so they read the schema's own tables
+        definition = list(c.execute("SELECT definition FROM pg_matviews "
+                + "WHERE schemaname = 'public' AND matviewname = (%s)", (view, )))[0][0]
+        indexes = [row[0] for row in c.execute("SELECT indexdef FROM pg_indexes "
+                + "WHERE schemaname = 'public' AND tablename = (%s)", (view, ))]
+
+        c.execute("SET search_path TO " + schema, ())
+        c.execute("CREATE MATERIALIZED VIEW " + schema + "." + view + " AS " + definition.rstrip().rstrip(";"), ())
+        for index in indexes:
+            c.execute(index.replace(" ON public.", " ON " + schema + "."), ())
+        c.execute("RESET search_path", ())
+
+    c.execute("SET search_path TO " + schema, ())
+    conn.commit()
+    c.close()
+
+def where_query(table, where):
+    query = "SELECT * FROM " + table
+    if len(where) > 0:
+        query += " WHERE " + " AND ".join(column + " = (%s)" for column in where)
+
+    return query
+
+class CountingCursor:
+    # counts and times every statement sent to the database
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        profiling.count("sql_statements")
+        with profiling.stage("sql"):
+            return self.cursor.execute(query, params)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def close(self):
+        self.cursor.close()
+
+class PostgresStorage:
+    def __init__(self, conn):
+        self.conn = conn
+        # raw column names -> decoded keys, the same few queries run over and over
+        self.keys = {}
+        # names of server side cursors
+        self.cursor_ids = itertools.count()
+
+    def cursor(self):
+        return CountingCursor(self.conn.cursor())
+
+    def column_keys(self, description):
+        names = tuple(k[0] for k in description)
+        if names not in self.keys:
+            self.keys[names] = [name.decode('ascii') for name in names]
+
+        return self.keys[names]
+
+    def select(self, query, params=()):
+        c = self.cursor()
+        rows = c.execute(query, params)
+        keys = self.column_keys(c.description)
+        results = [dict(zip(keys, row)) for row in rows]
+        c.close()
+
+        profiling.count("rows_read", len(results))
+
+        return results
+
+    def stream(self, query, params=(), chunk_rows=None):
+        # rows from a server side cursor, only one chunk is held at a time whatever the size of the result,
+        # the cursor lives until the transaction ends so nothing may commit while it is read
+        if chunk_rows is None:
+            chunk_rows = STREAM_CHUNK_ROWS
+
+        name = "stream_" + str(next(self.cursor_ids))
+        c = self.cursor()
+        c.execute("DECLARE " + name + " NO SCROLL CURSOR FOR " + query, params)
+        try:
+            while True:
+                rows = list(c.execute("FETCH FORWARD " + str(chunk_rows) + " FROM " + name, ()))
+                if len(rows) == 0:
+                    break
+
+                profiling.count("rows_read", len(rows))
+                profiling.count("chunks_read")
+                profiling.high_water("stream_chunk_rows", len(rows))
+
+                keys = self.column_keys(c.description)
+                for row in rows:
+                    yield dict(zip(keys, row))
+
+            # only once read to the end, after an error or an early stop the cursor goes with the transaction
+            # and a CLOSE here could fail in turn and hide what went wrong
+            c.execute("CLOSE " + name, ())
+        finally:
+            c.close()
+
+    def insert_rows(self, table, columns, rows, suffix=""):
+        row_params = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        profiling.count("rows_written", len(rows))
+
+        c = self.cursor()
+        for i in range(0, len(rows), BATCH_ROWS):
+            batch = rows[i:i + BATCH_ROWS]
+            params = [value for row in batch for value in row]
+            c.execute("INSERT INTO " + table + " (" + ", ".join(columns) + ") VALUES "
+                    + ", ".join([row_params] * len(batch)) + suffix,
+                    tuple(params))
+        c.close()
+
+    def add_counts(self, table, key_columns, rows):
+        # rows are (key..., count) with each key only appearing once
+        self.insert_rows(table, key_columns + ("counts", ), rows,
+                " ON CONFLICT (" + ", ".join(key_columns) + ") DO UPDATE SET counts = "
+                + table + ".counts + EXCLUDED.counts")
+
+    def commit(self):
+        profiling.count("sql_commits")
+        with profiling.stage("sql"):
+            self.conn.commit()
+
+    def rollback(self):
+        # a failed statement aborts the transaction, nothing else runs until it is rolled back
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+    def clear(self, tables=TABLES):
+        for table in tables:
+            c = self.cursor()
+            c.execute("DELETE FROM " + table, ())
+            self.commit()
+            c.close()
+
+    def remove_files(self, filepaths):
+        # related_funcs must already be cleared as it references functions
+        c = self.cursor()
+        for filepath in filepaths:
+            c.execute("DELETE FROM func_ownership WHERE func_id IN (SELECT id FROM functions WHERE filepath = (%s))",
+                    (filepath, ))
+            c.execute("DELETE FROM class_ownership WHERE class_id IN (SELECT id FROM classes WHERE filepath = (%s))",
+                    (filepath, ))
+            c.execute("DELETE FROM file_ownership WHERE file_path = (%s)", (filepath, ))
+            for table in FILE_TABLES:
+                c.execute("DELETE FROM " + table + " WHERE filepath = (%s)", (filepath, ))
+        self.commit()
+        c.close()
+
+    def rows(self, table, **where):
+        return self.select(where_query(table, where), tuple(where.values()))
+
+    def stream_rows(self, table, **where):
+        return self.stream(where_query(table, where), tuple(where.values()))
+
+    def find_inner_funcs(self, filename, start_line, end_line):
+        return self.select("SELECT * FROM functions where filename = (%s) and start_line <= (%s) and end_line >= (%s)",
+                (filename, start_line, end_line, ))
+
+    def find_funcs(self, filename, name):
+        return self.select("SELECT * FROM functions where filename = (%s) and name = (%s)",
+                (filename, name, ))
+
+    def contributors(self):
+        c = self.cursor()
+        rows = c.execute("SELECT DISTINCT contributor FROM contributor_ownership", ())
+        results = [row[0] for row in rows]
+        c.close()
+
+        return results
+
+    def assign_entity_ownership(self, filepaths=None):
+        # every function and class of the files, or of the whole snapshot, in one statement each
+        c = self.cursor()
+        for table, entities, id_column in ENTITY_OWNERSHIP:
+            if filepaths is None:
+                c.execute(entity_ownership_query(table, entities, id_column, False), ())
+            else:
+                c.execute(entity_ownership_query(table, entities, id_column, True), (list(filepaths), ))
+        self.commit()
+        c.close()
+
+    def refresh_rollups(self):
+        for view in ROLLUPS:
+            c = self.cursor()
+            c.execute("REFRESH MATERIALIZED VIEW " + view, ())
+            c.close()
+        self.commit()
+
+    def modified_scores(self):
+        funcs = self.select(RANK_QUERIES["modified_funcs"])
+        classes = self.select(RANK_QUERIES["modified_classes"])
+        files = self.select(RANK_QUERIES["modified_files"])
+
+        return funcs, classes, files
+
+    def related_scores(self):
+        # fill modified_func_ids
+        c = self.cursor()
+        c.execute(RANK_QUERIES["modified_func_ids"], ())
+        self.commit()
+        c.close()
+
+        # get caller funcs
+        caller_funcs = self.select(RANK_QUERIES["caller_funcs"])
+        # get called funcs
+        called_funcs = self.select(RANK_QUERIES["called_funcs"])
+
+        return caller_funcs, called_funcs
+
+    def api_scores(self):
+        return self.select(RANK_QUERIES["api"])
+
+def add_score(scores, contributor, score):
+    scores[contributor] = scores.get(contributor, 0.0) + score
+
+def score_rows(scores):
+    return [{"contributor": contributor, "score": score} for contributor, score in scores.items()]
+
+# columns of the memory storage's tables, counts tables are keyed on their columns instead
+MEMORY_COLUMNS = {
+    "snapshot": ("repo_path", "commit_sha"),
+    "functions": ("id", "filename", "filepath", "name", "start_line", "end_line"),
+    "classes": ("id", "filename", "filepath", "name", "start_line", "end_line"),
+    "func_call": ("filename", "filepath", "base_name", "name", "start_line", "end_line"),
+    "contributor_ownership": ("contributor", "filepath", "start_line", "end_line"),
+    "func_ownership": ("contributor", "func_id", "ownership"),
+    "class_ownership": ("contributor", "class_id", "ownership"),
+    "file_ownership": ("contributor", "file_path", "ownership"),
+    "related_funcs": ("caller_id", "called_id"),
+    "modified_funcs": ("filename", "filepath", "name"),
+    "modified_classes": ("filename", "filepath", "name"),
+    "modified_files": ("filepath", ),
+    "modified_func_ids": ("id", ),
+}
+
+# columns repeating the same few strings, stored as ids into the storage's string table
+STRING_COLUMNS = {"repo_path", "commit_sha", "filename", "filepath", "file_path", "name", "base_name", "base",
+        "contributor"}
+
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+
+        return string_id
+
+    def find(self, string):
+        # None when the string was never stored so nothing can match it
+        return self.ids.get(string)
+
+    def lookup(self, string_id):
+        return self.strings[string_id]
+
+class MemoryStorage:
+    # tables with a serial id column
+    ID_TABLES = ["functions", "classes"]
+    # tables with an upserted counts column, keyed on every other column
+    COUNT_TABLES = {"api_ownership": ("contributor", "base", "name", "filepath"),
+            "modified_func_calls": ("base_name", "name")}
+    # rows are tuples, a fraction of the size of a dict per row
+    RECORDS = {table: namedtuple(table, columns) for table, columns in MEMORY_COLUMNS.items()}
+    # tables with hash indexes on filepath and on the entity they own
+    FILEPATH_TABLES = ["functions", "classes", "func_call", "contributor_ownership"]
+    OWNER_TABLES = ["func_ownership", "class_ownership", "file_ownership"]
+
+    def __init__(self):
+        self.tables = {}
+        self.counts = {}
+        self.strings = StringTable()
+        self.next_id = {table: 1 for table in self.ID_TABLES}
+        # (table, inserted columns) -> how to build a record from an inserted row
+        self.layouts = {}
+        self.by_id = {}
+        self.by_filepath = {}
+        self.owners = {}
+        self.clear()
+
+    def clear(self, tables=TABLES):
+        for table in tables:
+            if table in self.COUNT_TABLES:
+                self.counts[table] = {}
+            else:
+                self.tables[table] = []
+
+        if all(len(rows) == 0 for rows in self.tables.values()) and all(len(counts) == 0
+                for counts in self.counts.values()):
+            # nothing refers to the old strings any more
+            self.strings = StringTable()
+
+        self.reindex(tables)
+
+    def find_ids(self, strings):
+        ids = {self.strings.find(string) for string in strings}
+        ids.discard(None)
+        return ids
+
+    def remove_files(self, filepaths):
+        filepaths = self.find_ids(filepaths)
+        func_ids = {row.id for row in self.tables["functions"] if row.filepath in filepaths}
+        class_ids = {row.id for row in self.tables["classes"] if row.filepath in filepaths}
+
+        for table in FILE_TABLES:
+            if table in self.COUNT_TABLES:
+                self.counts[table] = {key: count for key, count in self.counts[table].items()
+                        if key[-1] not in filepaths}
+            else:
+                self.tables[table] = [row for row in self.tables[table] if row.filepath not in filepaths]
+
+        self.tables["file_ownership"] = [row for row in self.tables["file_ownership"]
+                if row.file_path not in filepaths]
+        self.tables["func_ownership"] = [row for row in self.tables["func_ownership"]
+                if row.func_id not in func_ids]
+        self.tables["class_ownership"] = [row for row in self.tables["class_ownership"]
+                if row.class_id not in class_ids]
+
+        self.reindex(FILE_TABLES + self.OWNER_TABLES)
+
+    def reindex(self, tables=TABLES):
+        # hash indexes of the given tables, the rest of the snapshot keeps its indexes
+        for table in tables:
+            if table in self.ID_TABLES:
+                self.by_id[table] = {}
+            if table in self.FILEPATH_TABLES:
+                self.by_filepath[table] = {}
+            if table in self.OWNER_TABLES:
+                self.owners[table] = {}
+
+        if "functions" in tables:
+            self.funcs_by_filename = {}
+            self.funcs_by_name = {}
+            self.funcs_by_path_name = {}
+        if "classes" in tables:
+            self.classes_by_path_name = {}
+        if "api_ownership" in tables:
+            self.api_owners = {}
+
+        for table in tables:
+            for row in self.tables.get(table, []):
+                self.index_row(table, row)
+
+        if "api_ownership" in tables:
+            for key, count in self.counts["api_ownership"].items():
+                self.index_api_count(key, count)
+
+    def index_row(self, table, row):
+        if table in self.by_filepath:
+            self.by_filepath[table].setdefault(row.filepath, []).append(row)
+
+        if table in self.by_id:
+            self.by_id[table][row.id] = row
+
+        if table == "functions":
+            self.funcs_by_filename.setdefault(row.filename, []).append(row)
+            self.funcs_by_name.setdefault((row.filename, row.name), []).append(row)
+            self.funcs_by_path_name.setdefault((row.filepath, row.name), []).append(row)
+        elif table == "classes":
+            self.classes_by_path_name.setdefault((row.filepath, row.name), []).append(row)
+        elif table == "func_ownership":
+            self.owners[table].setdefault(row.func_id, []).append(row)
+        elif table == "class_ownership":
+            self.owners[table].setdefault(row.class_id, []).append(row)
+        elif table == "file_ownership":
+            self.owners[table].setdefault(row.file_path, []).append(row)
+
+    def layout(self, table, columns):
+        # for each record field the inserted column it comes from, None for a new id
+        key = (table, tuple(columns))
+        if key not in self.layouts:
+            positions = {column: i for i, column in enumerate(columns)}
+            self.layouts[key] = [(positions.get(field), field in STRING_COLUMNS)
+                    for field in self.RECORDS[table]._fields]
+
+        return self.layouts[key]
+
+    def insert_rows(self, table, columns, rows):
+        profiling.count("rows_written", len(rows))
+        record = self.RECORDS[table]
+        layout = self.layout(table, columns)
+        intern = self.strings.intern
+
+        for values in rows:
+            fields = []
+            for position, is_string in layout:
+                if position is None:
+                    fields.append(self.next_id[table])
+                    self.next_id[table] += 1
+                elif is_string:
+                    fields.append(intern(values[position]))
+                else:
+                    fields.append(values[position])
+
+            row = record._make(fields)
+            self.tables[table].append(row)
+            self.index_row(table, row)
+
+    def index_api_count(self, key, count):
+        contributor, base, name, filepath = key
+        owners = self.api_owners.setdefault((base, name), {})
+        owners[contributor] = owners.get(contributor, 0) + count
+
+    def add_counts(self, table, key_columns, rows):
+        profiling.count("rows_written", len(rows))
+        counts = self.counts[table]
+        intern = self.strings.intern
+        for values in rows:
+            key = tuple(intern(value) for value in values[:-1])
+            counts[key] = counts.get(key, 0) + values[-1]
+
+            if table == "api_ownership":
+                self.index_api_count(key, values[-1])
+
+    def commit(self):
+        return
+
+    def rollback(self):
+        return
+
+    def assign_entity_ownership(self, filepaths=None):
+        # the same overlap sums as the database, with one interval index per file
+        owned = self.by_filepath["contributor_ownership"]
+        if filepaths is None:
+            filepaths = list(owned)
+        else:
+            filepaths = [self.strings.find(filepath) for filepath in filepaths]
+
+        lookup = self.strings.lookup
+        rows = {table: [] for table, _, _ in ENTITY_OWNERSHIP}
+        for filepath in filepaths:
+            if filepath not in owned:
+                continue
+
+            owners = IntervalIndex([(row.start_line, row.end_line, row.contributor) for row in owned[filepath]])
+            for table, entities, _ in ENTITY_OWNERSHIP:
+                for entity in self.by_filepath[entities].get(filepath, []):
+                    size = entity.end_line - entity.start_line + 1
+                    for contributor, num_lines in owners.overlap_lengths(entity.start_line, entity.end_line).items():
+                        rows[table].append((lookup(contributor), entity.id, num_lines/size))
+
+        for table, _, id_column in ENTITY_OWNERSHIP:
+            self.insert_rows(table, ("contributor", id_column, "ownership"), rows[table])
+
+    def refresh_rollups(self):
+        # owners are already summed per entity by the hash indexes
+        return
+
+    def close(self):
+        return
+
+    def to_dict(self, columns, values):
+        # strings only come back out at the storage's boundary
+        lookup = self.strings.lookup
+        return {column: lookup(value) if column in STRING_COLUMNS else value
+                for column, value in zip(columns, values)}
+
+    def rows(self, table, **where):
+        return list(self.stream_rows(table, **where))
+
+    def stream_rows(self, table, **where):
+        # values are matched as ids, a string that was never stored matches nothing
+        match = {}
+        for column, value in where.items():
+            if column in STRING_COLUMNS:
+                value = self.strings.find(value)
+                if value is None:
+                    return
+            match[column] = value
+
+        if table in self.counts:
+            columns = self.COUNT_TABLES[table]
+            for key, count in list(self.counts[table].items()):
+                if all(key[columns.index(column)] == value for column, value in match.items()):
+                    yield dict(self.to_dict(columns, key), counts=count)
+            return
+
+        if "filepath" in match and table in self.by_filepath:
+            results = self.by_filepath[table].get(match["filepath"], [])
+        else:
+            results = self.tables[table]
+
+        # dicts are built one at a time, the records are already in memory
+        columns = self.RECORDS[table]._fields
+        for row in results:
+            if all(getattr(row, column) == value for column, value in match.items()):
+                yield self.to_dict(columns, row)
+
+    def find_inner_funcs(self, filename, start_line, end_line):
+        filename = self.strings.find(filename)
+        return [self.to_dict(MEMORY_COLUMNS["functions"], f) for f in self.funcs_by_filename.get(filename, [])
+                if f.start_line <= start_line and f.end_line >= end_line]
+
+    def find_funcs(self, filename, name):
+        key = (self.strings.find(filename), self.strings.find(name))
+        return [self.to_dict(MEMORY_COLUMNS["functions"], f) for f in self.funcs_by_name.get(key, [])]
+
+    def contributors(self):
+        return [self.strings.lookup(c) for c in {row.contributor for row in self.tables["contributor_ownership"]}]
+
+    def score_rows(self, scores):
+        return score_rows({self.strings.lookup(contributor): score for contributor, score in scores.items()})
+
+    def modified_scores(self):
+        funcs = {}
+        for mf in self.tables["modified_funcs"]:
+            for f in self.funcs_by_path_name.get((mf.filepath, mf.name), []):
+                for fo in self.owners["func_ownership"].get(f.id, []):
+                    add_score(funcs, fo.contributor, fo.ownership)
+
+        classes = {}
+        for mc in self.tables["modified_classes"]:
+            for cs in self.classes_by_path_name.get((mc.filepath, mc.name), []):
+                for co in self.owners["class_ownership"].get(cs.id, []):
+                    add_score(classes, co.contributor, co.ownership)
+
+        files = {}
+        for mf in self.tables["modified_files"]:
+            for fo in self.owners["file_ownership"].get(mf.filepath, []):
+                add_score(files, fo.contributor, fo.ownership)
+
+        return self.score_rows(funcs), self.score_rows(classes), self.score_rows(files)
+
+    def func_ids_score(self, func_ids):
+        scores = {}
+        for func_id in func_ids:
+            for fo in self.owners["func_ownership"].get(func_id, []):
+                add_score(scores, fo.contributor, fo.ownership)
+
+        return self.score_rows(scores)
+
+    def related_scores(self):
+        # fill modified_func_ids
+        modified_ids = set()
+        for mf in self.tables["modified_funcs"]:
+            for f in self.funcs_by_path_name.get((mf.filepath, mf.name), []):
+                modified_ids.add(f.id)
+        self.insert_rows("modified_func_ids", ("id", ), [(func_id, ) for func_id in sorted(modified_ids)])
+
+        modified_ids = {row.id for row in self.tables["modified_func_ids"]}
+
+        caller_ids = set()
+        called_ids = set()
+        for rf in self.tables["related_funcs"]:
+            if rf.called_id in modified_ids and rf.caller_id not in modified_ids:
+                caller_ids.add(rf.caller_id)
+            if rf.caller_id in modified_ids and rf.called_id not in modified_ids:
+                called_ids.add(rf.called_id)
+
+        return self.func_ids_score(caller_ids), self.func_ids_score(called_ids)
+
+    def api_scores(self):
+        scores = {}
+        for key, count in self.counts["modified_func_calls"].items():
+            for contributor, owned in self.api_owners.get(key, {}).items():
+                add_score(scores, contributor, count * owned)
+
+        return self.score_rows(scores)